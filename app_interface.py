@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import json
 
@@ -15,35 +16,61 @@ st.set_page_config(page_title="Análise de Materiais", layout="centered")
 
 # --- Funções de Comunicação com a API ---
 
-def buscar_materiais_chat(mensagem_chat: str):
+# Quantidade de sugestões por página ("Carregar mais" busca a próxima)
+TAMANHO_PAGINA = 5
+# Tempo que uma resposta de busca fica em cache entre as re-execuções do Streamlit
+CACHE_TTL_S = 300
+TIMEOUT_S = 30
+
+@st.cache_resource
+def get_sessao():
+    """
+    Sessão HTTP compartilhada por todos os usuários do Streamlit: mantém as conexões
+    com a API abertas (keep-alive) em vez de abrir uma nova a cada busca.
+    """
+    sessao = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    sessao.mount("http://", adaptador)
+    sessao.mount("https://", adaptador)
+    sessao.headers.update({"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"})
+    return sessao
+
+def normalizar_consulta(texto: str):
+    """Remove espaços extras, para que buscas equivalentes usem a mesma entrada do cache."""
+    return " ".join(texto.split())
+
+@st.cache_data(ttl=CACHE_TTL_S, show_spinner=False)
+def _post_em_cache(endpoint: str, payload: dict):
+    # Erros geram exceção e, por isso, não ficam no cache
+    response = get_sessao().post(f"{API_URL}{endpoint}", json=payload, timeout=TIMEOUT_S)
+    response.raise_for_status()
+    return response.json()
+
+def buscar_materiais_chat(mensagem_chat: str, offset: int = 0):
     """Envia uma mensagem para o endpoint /chat da API."""
-    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
-    payload = {"mensagem": mensagem_chat}
+    payload = {"mensagem": normalizar_consulta(mensagem_chat), "top_n": TAMANHO_PAGINA, "offset": offset}
     try:
-        response = requests.post(f"{API_URL}/chat", headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json(), None
+        return _post_em_cache("/chat", payload), None
     except requests.exceptions.RequestException as e:
         return None, f"Erro ao conectar com a API: {e}"
 
-def buscar_materiais_direto(descricao: str, um: str, familia: int):
+def buscar_materiais_direto(descricao: str, um: str, familia: int, offset: int = 0):
     """Envia uma busca direta para o endpoint /buscar da API."""
-    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
-    payload = {"descricao": descricao, "um": um, "familia": familia}
+    payload = {
+        "descricao": normalizar_consulta(descricao), "um": um.strip(), "familia": familia,
+        "top_n": TAMANHO_PAGINA, "offset": offset
+    }
     try:
-        response = requests.post(f"{API_URL}/buscar", headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json(), None
+        return _post_em_cache("/buscar", payload), None
     except requests.exceptions.RequestException as e:
         return None, f"Erro ao conectar com a API: {e}"
 
 
 def enviar_feedback(texto_original: str, entidades: list):
     """Envia feedback para o endpoint /feedback-ner da API."""
-    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
     payload = {"texto_original": texto_original, "entidades_corretas": entidades}
     try:
-        response = requests.post(f"{API_URL}/feedback-ner", headers=headers, json=payload)
+        response = get_sessao().post(f"{API_URL}/feedback-ner", json=payload, timeout=TIMEOUT_S)
         response.raise_for_status()
         return True, response.json().get("mensagem", "Feedback enviado com sucesso.")
     except requests.exceptions.HTTPError as e:
@@ -54,6 +81,24 @@ def enviar_feedback(texto_original: str, entidades: list):
     except requests.exceptions.RequestException as e:
         return False, f"Erro de conexão: {e}"
 
+def carregar_mais_resultados():
+    """Busca a próxima página da última busca (chat ou direta) e junta aos resultados."""
+    offset = len(st.session_state.resultados or [])
+    # Pagina a partir da consulta que foi buscada, e não do texto que está no campo agora
+    tipo, *consulta = st.session_state.origem_busca
+    if tipo == "chat":
+        resposta, erro = buscar_materiais_chat(*consulta, offset=offset)
+        chave = "sugestoes"
+    else:
+        resposta, erro = buscar_materiais_direto(*consulta, offset=offset)
+        chave = "resultados"
+
+    if erro:
+        st.session_state.erro = erro
+        return
+    st.session_state.resultados = (st.session_state.resultados or []) + resposta.get(chave, [])
+    st.session_state.tem_mais = resposta.get("tem_mais", False)
+
 # --- Interface Gráfica (UI) ---
 
 st.title("🤖 Assistente de Análise de Materiais")
@@ -70,6 +115,10 @@ if 'erro' not in st.session_state:
     st.session_state.erro = None
 if 'chat_mensagem' not in st.session_state:
     st.session_state.chat_mensagem = ""
+if 'tem_mais' not in st.session_state:
+    st.session_state.tem_mais = False
+if 'origem_busca' not in st.session_state:
+    st.session_state.origem_busca = ("chat", "")
 
 # Campo de entrada de texto
 st.session_state.chat_mensagem = st.text_input(
@@ -91,6 +140,8 @@ if st.button("Buscar"):
             elif resposta and resposta.get("status") == "sucesso":
                 st.session_state.resultados = resposta.get("sugestoes", [])
                 st.session_state.entidades = resposta.get("entidades_extraidas", {})
+                st.session_state.tem_mais = resposta.get("tem_mais", False)
+                st.session_state.origem_busca = ("chat", st.session_state.chat_mensagem)
                 st.session_state.erro = None
             else:
                 st.session_state.erro = resposta.get("mensagem", "Ocorreu um erro desconhecido.")
@@ -127,6 +178,11 @@ if st.session_state.busca_realizada:
                 st.markdown(f"**Família:** `{item['FAMILIA']}`")
                 st.markdown(f"**UM:** `{item['UM']}`")
 
+        if st.session_state.tem_mais and st.button("Carregar mais"):
+            with st.spinner("Buscando mais sugestões..."):
+                carregar_mais_resultados()
+            st.rerun()
+
     # --- Formulário de Feedback em um Expander ---
     st.markdown("---")
     with st.expander("A extração está incorreta? Clique aqui para corrigir."):
@@ -154,28 +210,29 @@ if st.session_state.busca_realizada:
             if not descricao_correta:
                 st.warning("A descrição é obrigatória para o feedback.")
             else:
-                with st.spinner("Enviando feedback e retreinando o modelo..."):
-                    sucesso, mensagem = enviar_feedback(st.session_state.chat_mensagem, entidades_feedback)
-                    if sucesso:
-                        st.success(f"Feedback enviado! Mensagem da API: '{mensagem}'")
-                    else:
-                        st.error(f"Erro ao enviar feedback: {mensagem}")
-
-                # --- Refaz a busca com os dados corrigidos ---
+                # Valida se a família é um inteiro antes de buscar
+                familia_int = int(familia_correta) if familia_correta.isdigit() else 0
+
+                # O feedback e a nova busca são independentes: os dois são enviados ao mesmo tempo
+                with st.spinner("Enviando feedback e refazendo a busca com os dados corrigidos..."):
+                    with ThreadPoolExecutor(max_workers=1) as executor:
+                        envio_feedback = executor.submit(enviar_feedback, st.session_state.chat_mensagem, entidades_feedback)
+                        resposta_direta, erro_direto = buscar_materiais_direto(descricao_correta, um_correta, familia_int)
+                        sucesso, mensagem = envio_feedback.result()
+
                 if sucesso:
-                    with st.spinner("Refazendo a busca com os dados corrigidos..."):
-                        try:
-                            # Valida se a família é um inteiro antes de buscar
-                            familia_int = int(familia_correta) if familia_correta.isdigit() else 0
-                            
-                            resposta_direta, erro_direto = buscar_materiais_direto(descricao_correta, um_correta, familia_int)
-                            if erro_direto:
-                                st.error(erro_direto)
-                            else:
-                                st.info("Resultados atualizados com base na sua correção:")
-                                # Atualiza o estado da sessão para forçar o rerender da tela com os novos resultados
-                                st.session_state.resultados = resposta_direta.get("resultados", [])
-                                st.session_state.entidades = {"DESCRICAO": descricao_correta, "UM": um_correta, "FAMILIA": familia_correta}
-                                st.rerun() # Força a re-renderização da página
-                        except Exception as e:
-                            st.error(f"Ocorreu um erro ao refazer a busca: {e}")
\ No newline at end of file
+                    st.success(f"Feedback enviado! Mensagem da API: '{mensagem}'")
+                else:
+                    st.error(f"Erro ao enviar feedback: {mensagem}")
+
+                # --- Exibe a busca refeita com os dados corrigidos ---
+                if erro_direto:
+                    st.error(erro_direto)
+                elif sucesso:
+                    st.info("Resultados atualizados com base na sua correção:")
+                    # Atualiza o estado da sessão para forçar o rerender da tela com os novos resultados
+                    st.session_state.resultados = resposta_direta.get("resultados", [])
+                    st.session_state.tem_mais = resposta_direta.get("tem_mais", False)
+                    st.session_state.origem_busca = ("direta", descricao_correta, um_correta, familia_int)
+                    st.session_state.entidades = {"DESCRICAO": descricao_correta, "UM": um_correta, "FAMILIA": familia_correta}
+                    st.rerun() # Força a re-renderização da página
@@ -0,0 +1,140 @@
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+def _em_ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 3)
+
+class AvaliadorSombra:
+    """
+    Modo sombra do modelo NER: uma amostra das mensagens do /chat passa, em segundo
+    plano, pelo mesmo extrator do /chat (regras + modelo) com o modelo atual e com o
+    candidato (registrado no manifesto de versões), medindo a latência de cada um e se
+    as entidades entregues ao usuário concordam. A resposta nunca depende do candidato.
+    """
+    def __init__(self, repositorio, fracao_amostra=0.1, max_amostras=1000, tamanho_fila=100):
+        self.repositorio = repositorio
+        self.fracao_amostra = fracao_amostra
+        self.versao_candidato = None
+        self._nlp_candidato = None
+        self._mtime_manifesto = None
+        self._amostras = deque(maxlen=max_amostras)
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._processar_fila, daemon=True)
+        self._thread.start()
+
+    def observar(self, mensagem, nlp_atual, extrator):
+        """Chamado no /chat: só sorteia e enfileira, sem custo perceptível para a requisição."""
+        if nlp_atual is None or random.random() >= self.fracao_amostra:
+            return
+        try:
+            self._fila.put_nowait((mensagem, nlp_atual, extrator))
+        except queue.Full:
+            pass  # Sob carga, amostras são descartadas em vez de atrasar o chat
+
+    def _processar_fila(self):
+        while True:
+            mensagem, nlp_atual, extrator = self._fila.get()
+            try:
+                self._atualizar_candidato()
+                if self._nlp_candidato is not None:
+                    self._avaliar(mensagem, nlp_atual, extrator)
+            except Exception as e:
+                logging.error(f"Erro na avaliação em modo sombra: {e}")
+
+    def _atualizar_candidato(self):
+        """Carrega o candidato quando o manifesto muda (verificação barata por mtime)."""
+        import spacy
+
+        try:
+            mtime = os.path.getmtime(self.repositorio.manifesto_path)
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime_manifesto:
+            return
+        self._mtime_manifesto = mtime
+
+        candidato = self.repositorio.ler_manifesto().get("candidato")
+        if candidato == self.versao_candidato:
+            return
+
+        nlp_candidato = spacy.load(self.repositorio.caminho(candidato)) if candidato else None
+        with self._lock:
+            self.versao_candidato = candidato
+            self._nlp_candidato = nlp_candidato
+            self._amostras.clear()
+        if candidato:
+            logging.info(f"Modo sombra: avaliando o candidato '{candidato}'.")
+
+    def _avaliar(self, mensagem, nlp_atual, extrator):
+        # Sem o cache do extrator: os dois modelos precisam de fato processar a mensagem
+        mensagem = mensagem.strip()
+        inicio = time.perf_counter()
+        entidades_atual = extrator._extrair_sem_cache(mensagem, nlp_atual)
+        latencia_atual = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        entidades_candidato = extrator._extrair_sem_cache(mensagem, self._nlp_candidato)
+        latencia_candidato = time.perf_counter() - inicio
+
+        with self._lock:
+            self._amostras.append((latencia_atual, latencia_candidato, entidades_atual == entidades_candidato))
+
+    def descartar_candidato(self):
+        """Esquece o candidato atual (após promoção); um novo será lido do manifesto."""
+        with self._lock:
+            self.versao_candidato = None
+            self._nlp_candidato = None
+            self._mtime_manifesto = None
+            self._amostras.clear()
+
+    def metricas(self):
+        with self._lock:
+            amostras = list(self._amostras)
+            versao = self.versao_candidato
+        latencias_atual = [a[0] for a in amostras]
+        latencias_candidato = [a[1] for a in amostras]
+        return {
+            "candidato": versao,
+            "amostras": len(amostras),
+            "concordancia": sum(a[2] for a in amostras) / len(amostras) if amostras else None,
+            "latencia_atual_p50_ms": _em_ms(_percentil(latencias_atual, 0.5)),
+            "latencia_atual_p95_ms": _em_ms(_percentil(latencias_atual, 0.95)),
+            "latencia_candidato_p50_ms": _em_ms(_percentil(latencias_candidato, 0.5)),
+            "latencia_candidato_p95_ms": _em_ms(_percentil(latencias_candidato, 0.95)),
+        }
+
+    def avaliar_promocao(self, candidato, min_amostras, min_concordancia, max_razao_latencia):
+        """
+        Retorna (aprovado, motivos) segundo os critérios de promoção. As métricas só valem
+        se forem do 'candidato' informado (o registrado no manifesto), e não de um anterior.
+        """
+        metricas = self.metricas()
+        motivos = []
+        if metricas["candidato"] is None:
+            return False, ["Nenhum candidato em avaliação."]
+        if metricas["candidato"] != candidato:
+            return False, [
+                f"As métricas são do candidato '{metricas['candidato']}', não de '{candidato}', "
+                "que ainda não foi avaliado."
+            ]
+        if metricas["amostras"] < min_amostras:
+            motivos.append(f"Amostras insuficientes: {metricas['amostras']} de {min_amostras}.")
+        elif metricas["amostras"] > 0:
+            if metricas["concordancia"] < min_concordancia:
+                motivos.append(f"Concordância de {metricas['concordancia']:.2%} abaixo do mínimo de {min_concordancia:.2%}.")
+            razao = metricas["latencia_candidato_p95_ms"] / max(metricas["latencia_atual_p95_ms"], 1e-6)
+            if razao > max_razao_latencia:
+                motivos.append(f"Latência p95 do candidato {razao:.2f}x a do modelo atual (máximo {max_razao_latencia:.2f}x).")
+        return not motivos, motivos
@@ -0,0 +1,227 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Tempo máximo de espera de um fragmento para carregar sua parte dos embeddings
+TIMEOUT_INICIO_S = 300
+# Tempo máximo de espera pela resposta de uma busca (as buscas são interativas)
+TIMEOUT_BUSCA_S = float(os.getenv("BUSCA_FRAGMENTO_TIMEOUT_S", "5"))
+
+class FragmentoIndisponivel(RuntimeError):
+    """Um fragmento está fora do ar (travado, encerrado ou em reconstrução)."""
+
+def _normalizar(matriz):
+    matriz = np.asarray(matriz, dtype=np.float32)
+    return matriz / np.maximum(np.linalg.norm(matriz, axis=1, keepdims=True), 1e-12)
+
+def _servir_fragmento(conexao, embeddings_path, catalogo_dir, particao, chave):
+    """
+    Processo de um fragmento: carrega só as suas linhas dos embeddings e responde
+    às buscas do coordenador pela conexão com os top-k por similaridade de cosseno.
+    """
+    from .catalogo import Catalogo
+
+    try:
+        catalogo = Catalogo(catalogo_dir)
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        if particao == "familia":
+            indices = np.flatnonzero(np.isin(catalogo.familia_codigos, chave))
+        else:
+            indices = np.arange(*chave)
+
+        matriz = _normalizar(embeddings[indices])
+        conexao.send(("pronto", len(indices)))
+    except Exception as e:
+        conexao.send(("erro", str(e)))
+        return
+
+    while True:
+        mensagem = conexao.recv()
+        if mensagem[0] == "encerrar":
+            break
+        try:
+            _, consultas, top_k = mensagem
+            k = min(top_k, len(indices))
+            if k == 0:
+                conexao.send(("ok", [(np.empty(0, np.int64), np.empty(0, np.float32))] * len(consultas)))
+                continue
+
+            scores = consultas @ matriz.T
+            melhores = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            melhores_scores = np.take_along_axis(scores, melhores, axis=1)
+            conexao.send(("ok", [(indices[m], s) for m, s in zip(melhores, melhores_scores)]))
+        except Exception as e:
+            conexao.send(("erro", str(e)))
+
+class _Fragmento:
+    def __init__(self, contexto, embeddings_path, catalogo_dir, particao, chave):
+        self.chave = chave
+        self.conexao, conexao_filho = contexto.Pipe()
+        self.processo = contexto.Process(
+            target=_servir_fragmento,
+            args=(conexao_filho, embeddings_path, catalogo_dir, particao, chave),
+            daemon=True,
+        )
+        self.processo.start()
+        conexao_filho.close()
+        try:
+            self.linhas = self._receber(TIMEOUT_INICIO_S)
+        except TimeoutError:
+            self.terminar()
+            raise
+
+    def _receber(self, timeout):
+        if not self.conexao.poll(timeout):
+            raise TimeoutError("Fragmento não respondeu dentro do tempo limite.")
+        estado, conteudo = self.conexao.recv()
+        if estado == "erro":
+            raise RuntimeError(f"Erro no fragmento: {conteudo}")
+        return conteudo
+
+    def buscar(self, consultas, top_k):
+        self.conexao.send(("buscar", consultas, top_k))
+        return self._receber(TIMEOUT_BUSCA_S)
+
+    def terminar(self):
+        """Mata o processo sem esperar resposta (fragmento travado ou que caiu)."""
+        self.processo.terminate()
+        self.processo.join(timeout=5)
+        self.conexao.close()
+
+    def encerrar(self):
+        try:
+            self.conexao.send(("encerrar",))
+        except (BrokenPipeError, OSError):
+            pass
+        self.processo.join(timeout=5)
+        if self.processo.is_alive():
+            self.processo.terminate()
+        self.conexao.close()
+
+class IndiceFragmentado:
+    """
+    Índice de embeddings particionado entre processos locais (por faixa de linhas ou por
+    FAMILIA). Cada busca é enviada a todos os fragmentos em paralelo (scatter), cada um
+    devolve seus top-k semânticos e o coordenador junta os resultados (gather). O bônus
+    de UM/FAMILIA é aplicado depois, como na busca sem fragmentos.
+    """
+    def __init__(self, embeddings_path, catalogo, catalogo_dir, fragmentos, particao="linhas"):
+        if particao not in ("linhas", "familia"):
+            raise ValueError("A partição deve ser 'linhas' ou 'familia'.")
+        self.embeddings_path = embeddings_path
+        self.catalogo_dir = catalogo_dir
+        self.particao = particao
+        self.chaves = self._particionar(catalogo, fragmentos)
+        self._contexto = multiprocessing.get_context("spawn")
+        self._fragmentos = [None] * len(self.chaves)
+        self._locks = [threading.Lock() for _ in self.chaves]
+        self._executor = ThreadPoolExecutor(max_workers=len(self.chaves))
+        self._encerrado = False
+
+    def _particionar(self, catalogo, fragmentos):
+        linhas = len(catalogo)
+        fragmentos = max(1, min(fragmentos, linhas))
+        if self.particao == "linhas":
+            limites = np.linspace(0, linhas, fragmentos + 1, dtype=np.int64)
+            return [(int(inicio), int(fim)) for inicio, fim in zip(limites[:-1], limites[1:])]
+
+        # Distribui as famílias entre os fragmentos equilibrando o número de linhas
+        contagem = np.bincount(np.asarray(catalogo.familia_codigos), minlength=len(catalogo.familia_categorias))
+        fragmentos = min(fragmentos, int(np.count_nonzero(contagem)))
+        grupos = [[] for _ in range(fragmentos)]
+        totais = [0] * fragmentos
+        for codigo in np.argsort(-contagem):
+            if contagem[codigo] == 0:
+                break
+            destino = totais.index(min(totais))
+            grupos[destino].append(int(codigo))
+            totais[destino] += int(contagem[codigo])
+        return grupos
+
+    def _criar_fragmento(self, i):
+        return _Fragmento(self._contexto, self.embeddings_path, self.catalogo_dir, self.particao, self.chaves[i])
+
+    def iniciar(self):
+        """Sobe os processos de todos os fragmentos em paralelo."""
+        novos = list(self._executor.map(self._criar_fragmento, range(len(self.chaves))))
+        for i, fragmento in enumerate(novos):
+            with self._locks[i]:
+                self._fragmentos[i] = fragmento
+        logging.info(
+            f"Busca fragmentada iniciada: {len(novos)} fragmentos por {self.particao} "
+            f"({', '.join(str(f.linhas) for f in novos)} linhas)."
+        )
+
+    def prontos(self):
+        return all(fragmento is not None for fragmento in self._fragmentos)
+
+    def reconstruir_fragmento(self, i):
+        """
+        Recarrega um único fragmento do disco. O novo processo é criado antes de o antigo
+        ser encerrado, então o fragmento continua atendendo buscas durante a reconstrução.
+        """
+        novo = self._criar_fragmento(i)
+        with self._locks[i]:
+            antigo, self._fragmentos[i] = self._fragmentos[i], novo
+        if antigo is not None:
+            antigo.encerrar()
+        logging.info(f"Fragmento {i} reconstruído ({novo.linhas} linhas).")
+
+    def _reconstruir_apos_falha(self, i):
+        if self._encerrado:
+            return
+        try:
+            self.reconstruir_fragmento(i)
+        except Exception as e:
+            logging.error(f"Erro ao reconstruir o fragmento {i}: {e}")
+
+    def _buscar_no_fragmento(self, i, consultas, top_k):
+        with self._locks[i]:
+            fragmento = self._fragmentos[i]
+            if fragmento is None:
+                raise FragmentoIndisponivel(f"Fragmento {i} não está disponível.")
+            try:
+                return fragmento.buscar(consultas, top_k)
+            except (TimeoutError, EOFError, OSError) as e:
+                # Fragmento travado ou que caiu (EOF/pipe quebrado). Se travado, a resposta
+                # atrasada ficaria no pipe e seria lida pela próxima busca como se fosse
+                # dela: nos dois casos o processo é descartado e reconstruído em segundo plano.
+                falha = e
+                self._fragmentos[i] = None
+        fragmento.terminar()
+        logging.error(f"Fragmento {i} fora do ar ({type(falha).__name__}: {falha}); reconstruindo.")
+        threading.Thread(target=self._reconstruir_apos_falha, args=(i,), daemon=True).start()
+        raise FragmentoIndisponivel(f"Fragmento {i} fora do ar: {falha}")
+
+    def buscar(self, consultas, top_k):
+        """
+        Retorna, para cada consulta, a lista ordenada dos top_k hits ({'corpus_id', 'score'})
+        por similaridade de cosseno, sem bônus. Lança FragmentoIndisponivel se algum
+        fragmento estiver fora do ar.
+        """
+        consultas = _normalizar(consultas)
+        tarefas = [
+            self._executor.submit(self._buscar_no_fragmento, i, consultas, top_k)
+            for i in range(len(self.chaves))
+        ]
+        respostas = [tarefa.result() for tarefa in tarefas]
+
+        resultados = []
+        for q in range(len(consultas)):
+            ids = np.concatenate([resposta[q][0] for resposta in respostas])
+            scores = np.concatenate([resposta[q][1] for resposta in respostas])
+            ordem = np.argsort(-scores, kind="stable")[:top_k]
+            resultados.append([{"corpus_id": int(ids[j]), "score": float(scores[j])} for j in ordem])
+        return resultados
+
+    def encerrar(self):
+        self._encerrado = True
+        for i, fragmento in enumerate(self._fragmentos):
+            if fragmento is not None:
+                fragmento.encerrar()
+                self._fragmentos[i] = None
+        self._executor.shutdown(wait=False)
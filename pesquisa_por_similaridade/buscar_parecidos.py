@@ -1,73 +1,152 @@
-import pandas as pd
-import numpy as np
-from sentence_transformers import SentenceTransformer, util
+import json
 import logging
 import os
+import threading
+from .versionamento import repositorio_indice
 
 # --- Configuração Inicial ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Carrega o modelo e os embeddings uma vez quando o módulo é importado
 MODELO_NOME = 'all-MiniLM-L6-v2'
-EMBEDDINGS_PATH = "./pesquisa_por_similaridade/embeddings.npy"
-
-try:
-    logging.info(f"Carregando modelo '{MODELO_NOME}' para a memória...")
-    model = SentenceTransformer(MODELO_NOME)
-    logging.info("Modelo carregado.")
-
-    logging.info(f"Carregando embeddings pré-calculados de '{EMBEDDINGS_PATH}'...")
-    corpus_embeddings = np.load(EMBEDDINGS_PATH)
-    logging.info(f"Embeddings carregados. Shape: {corpus_embeddings.shape}")
-
-except FileNotFoundError:
-    logging.error(f"Arquivo de embeddings '{EMBEDDINGS_PATH}' não encontrado.")
-    logging.error("Execute o script 'gerar_embeddings.py' primeiro.")
-    model = None
-    corpus_embeddings = None
-except Exception as e:
-    logging.error(f"Erro ao carregar modelo ou embeddings: {e}")
-    model = None
-    corpus_embeddings = None
-
-def buscar_parecidos_semantico(descricao_query: str, um: str, familia: int, dados: pd.DataFrame, top_n=5):
+EMBEDDINGS_ARQUIVO = "embeddings.npy"
+EMBEDDINGS_META_ARQUIVO = "embeddings.json"
+
+# Os embeddings são versionados: o manifesto indica qual diretório está em uso
+repositorio = repositorio_indice()
+
+# O modelo e os embeddings são carregados sob demanda (ou em segundo plano pela API),
+# para que importar este módulo não traga torch/sentence-transformers para a memória.
+model = None
+corpus_embeddings = None
+embeddings_meta = None
+# Diretório da versão do índice em memória
+diretorio_indice = None
+_carregamento_lock = threading.Lock()
+
+# Índice fragmentado entre processos (opcional). Quando configurado, substitui a
+# varredura de todo o corpus em um único processo.
+indice_fragmentado = None
+
+def caminho_embeddings(diretorio=None):
+    """Caminho do arquivo de embeddings da versão em uso (ou do diretório informado)."""
+    return os.path.join(diretorio or repositorio.caminho_atual(), EMBEDDINGS_ARQUIVO)
+
+def _ler_indice(diretorio):
+    """Lê os embeddings e os metadados de um diretório de índice."""
+    import numpy as np
+
+    embeddings_path = caminho_embeddings(diretorio)
+    logging.info(f"Carregando embeddings pré-calculados de '{embeddings_path}'...")
+    embeddings = np.load(embeddings_path)
+    logging.info(f"Embeddings carregados. Shape: {embeddings.shape}")
+
+    meta_path = os.path.join(diretorio, EMBEDDINGS_META_ARQUIVO)
+    if not os.path.exists(meta_path):
+        logging.warning(
+            f"Metadados '{meta_path}' não encontrados; só o número de linhas "
+            "será conferido contra o catálogo."
+        )
+        return embeddings, None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return embeddings, json.load(f)
+
+def carregar_recursos_semanticos():
     """
-    Busca os materiais mais parecidos usando similaridade semântica (embeddings).
+    Carrega o modelo de sentence-transformer e os embeddings pré-calculados.
+    É seguro chamar várias vezes: o carregamento acontece uma única vez.
+    Retorna True se os recursos estiverem disponíveis.
     """
-    if model is None or corpus_embeddings is None:
-        raise RuntimeError("O modelo de busca semântica não foi carregado corretamente. Verifique os logs.")
+    global model, corpus_embeddings, embeddings_meta, diretorio_indice
+
+    with _carregamento_lock:
+        if model is not None and corpus_embeddings is not None:
+            return True
+
+        try:
+            from sentence_transformers import SentenceTransformer
 
-    # Gera o embedding para a descrição da busca
-    query_embedding = model.encode(descricao_query, convert_to_tensor=True)
+            logging.info(f"Carregando modelo '{MODELO_NOME}' para a memória...")
+            modelo_carregado = SentenceTransformer(MODELO_NOME)
+            logging.info("Modelo carregado.")
+
+            diretorio = repositorio.caminho_atual()
+            embeddings_carregados, meta = _ler_indice(diretorio)
+
+            # Aquecimento: o primeiro encode aloca buffers e inicializa os kernels,
+            # então é feito aqui e não na primeira requisição do usuário.
+            modelo_carregado.encode(["aquecimento do modelo"], convert_to_tensor=True)
+            logging.info("Aquecimento do modelo semântico concluído.")
+
+            model = modelo_carregado
+            corpus_embeddings = embeddings_carregados
+            embeddings_meta = meta
+            diretorio_indice = diretorio
+            return True
+
+        except FileNotFoundError as e:
+            logging.error(f"Arquivo de embeddings não encontrado: {e}")
+            logging.error("Execute o script 'gerar_embeddings.py' primeiro.")
+        except Exception as e:
+            logging.error(f"Erro ao carregar modelo ou embeddings: {e}")
+        return False
+
+def recarregar_indice(diretorio, catalogo):
+    """
+    Lê os embeddings de outra versão do índice, confere contra o catálogo e só então
+    troca os que estão em memória. Em caso de erro, o índice atual continua em uso.
+    """
+    global corpus_embeddings, embeddings_meta, diretorio_indice
+
+    embeddings, meta = _ler_indice(diretorio)
+    catalogo.verificar_embeddings(embeddings, meta)
+    with _carregamento_lock:
+        corpus_embeddings, embeddings_meta, diretorio_indice = embeddings, meta, diretorio
+
+def diretorio_indice_em_uso():
+    """Diretório da versão do índice cujos embeddings estão em memória."""
+    return diretorio_indice
+
+def recursos_semanticos_prontos():
+    """Indica se o modelo e os embeddings já estão em memória."""
+    return model is not None and corpus_embeddings is not None
+
+def verificar_alinhamento(catalogo):
+    """
+    Confere se os embeddings carregados correspondem ao catálogo (linhas e hash).
+    Lança ValueError em caso de divergência.
+    """
+    catalogo.verificar_embeddings(corpus_embeddings, embeddings_meta)
 
-    # Calcula a similaridade de cosseno entre a busca e todos os materiais
-    hits = util.semantic_search(query_embedding, corpus_embeddings, top_k=top_n * 2)
-    hits = hits[0]  # A busca é para uma única query
+def configurar_busca_fragmentada(indice):
+    """Passa a usar (ou, com None, deixa de usar) o índice fragmentado nas buscas."""
+    global indice_fragmentado
+    indice_fragmentado = indice
 
-    # Adiciona bônus para UM e Família e recalcula o score
+def _pontuar_hits(hits, um, familia, catalogo, top_n):
+    """Aplica o bônus de UM e Família aos hits semânticos e retorna os top_n materiais."""
     resultados = []
     indices_vistos = set()
 
     for hit in hits:
         idx = hit['corpus_id']
         if idx not in indices_vistos:
-            
+
             # Score de similaridade semântica (0 a 1)
             score_semantico = hit['score']
-            
+
             # Pega os dados do material correspondente
-            material = dados.iloc[idx]
-            
+            material = catalogo.linha(idx)
+
             # Adiciona bônus
             bonus = 0
             if material['FAMILIA'] == familia:
                 bonus += 0.2  # Bônus de 20%
             if material['UM'] == um:
                 bonus += 0.2  # Bônus de 20%
-                
+
             # Score final, limitado a 1.0
             score_final = min(score_semantico + bonus, 1.0)
-            
+
             resultados.append({
                 "CODIGO": material['CODIGO'],
                 "DESCRICAO": material['DESCRICAO'],
@@ -78,5 +157,65 @@ def buscar_parecidos_semantico(descricao_query: str, um: str, familia: int, dado
             indices_vistos.add(idx)
 
     # Ordena os resultados pelo score final e retorna o top_n
-    df_res = pd.DataFrame(resultados).sort_values(by='SCORE', ascending=False)
-    return df_res.head(top_n)
\ No newline at end of file
+    resultados.sort(key=lambda r: r['SCORE'], reverse=True)
+    return resultados[:top_n]
+
+def buscar_parecidos_semantico_lote(descricoes, ums, familias, catalogo, top_n=5, candidatos=None):
+    """
+    Versão em lote de buscar_parecidos_semantico: codifica todas as descrições de uma vez
+    e retorna, para cada uma, a lista dos top_n materiais mais parecidos.
+    'candidatos' é quantos hits semânticos recebem o bônus de UM/Família e são
+    reordenados (padrão: top_n * 2). Quanto maior, mais um material de menor similaridade
+    com a mesma UM e Família pode subir no ranking.
+    """
+    from sentence_transformers import util
+
+    if not carregar_recursos_semanticos():
+        raise RuntimeError("O modelo de busca semântica não foi carregado corretamente. Verifique os logs.")
+    if corpus_embeddings.shape[0] != len(catalogo):
+        raise RuntimeError("Os embeddings não estão alinhados com o catálogo. Execute 'gerar_embeddings.py' novamente.")
+    candidatos = max(candidatos or top_n * 2, top_n)
+
+    # Nos dois caminhos, o bônus de UM/Família é aplicado sobre os mesmos 'candidatos'
+    # hits semânticos, então os resultados não dependem de BUSCA_FRAGMENTOS.
+    # Gera os embeddings de todas as descrições em um único batch
+    query_embeddings = model.encode(descricoes, convert_to_tensor=True)
+
+    hits_lote = None
+    if indice_fragmentado is not None:
+        from .busca_fragmentada import FragmentoIndisponivel
+
+        try:
+            hits_lote = indice_fragmentado.buscar(query_embeddings.cpu().numpy(), top_k=candidatos)
+        except FragmentoIndisponivel as e:
+            # Enquanto o fragmento é reconstruído, a busca usa os embeddings em memória
+            logging.warning(f"Busca fragmentada indisponível, usando o índice completo: {e}")
+
+    if hits_lote is None:
+        # Calcula a similaridade de cosseno entre cada busca e todos os materiais
+        hits_lote = util.semantic_search(query_embeddings, corpus_embeddings, top_k=candidatos)
+
+    return [
+        _pontuar_hits(hits, um, familia, catalogo, top_n)
+        for hits, um, familia in zip(hits_lote, ums, familias)
+    ]
+
+def buscar_parecidos_semantico(descricao_query: str, um: str, familia: int, catalogo, top_n=5, candidatos=None):
+    """
+    Busca os materiais mais parecidos usando similaridade semântica (embeddings).
+    """
+    import pandas as pd
+
+    resultados = buscar_parecidos_semantico_lote(
+        [descricao_query], [um], [familia], catalogo, top_n=top_n, candidatos=candidatos
+    )[0]
+    return pd.DataFrame(resultados, columns=["CODIGO", "DESCRICAO", "UM", "FAMILIA", "SCORE"])
+
+def buscar_similares_por_indice(idx, catalogo, grafo, top_n=5):
+    """
+    Busca os materiais parecidos com o material da linha idx usando o grafo de vizinhos
+    pré-calculado: custa O(k) e não usa o modelo de sentence-transformer.
+    """
+    material = catalogo.linha(idx)
+    hits = grafo.vizinhos(idx)
+    return _pontuar_hits(hits, material['UM'], material['FAMILIA'], catalogo, top_n)
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Arquivos que compõem o catálogo compilado (um .npy por coluna + manifesto)
+MANIFESTO = "manifesto.json"
+COLUNAS = [
+    "codigo", "codigo_ordem",
+    "descricao_dados", "descricao_offsets",
+    "um_codigos", "um_categorias",
+    "familia_codigos", "familia_categorias",
+]
+
+def hash_descricoes(descricoes):
+    """
+    Calcula o hash das descrições, na ordem das linhas. É o mesmo hash gravado
+    junto aos embeddings, para garantir que a linha i do catálogo é o embedding i.
+    """
+    h = hashlib.sha256(f"{len(descricoes)}\n".encode("utf-8"))
+    for descricao in descricoes:
+        h.update(descricao.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+def _categorizar(valores, dtype):
+    categorias, codigos = np.unique(np.asarray(valores, dtype=dtype), return_inverse=True)
+    return codigos.astype(np.int16 if len(categorias) < 2**15 else np.int32), categorias
+
+def salvar_catalogo(dados, diretorio, origem=""):
+    """
+    Grava o DataFrame (CODIGO, DESCRICAO, UM, FAMILIA) no formato colunar.
+    As colunas são escritas em um diretório temporário, que entra no lugar do atual
+    com duas renomeações (o atual é afastado e o novo, renomeado). Entre elas o
+    diretório fica ausente por um instante, mas nunca pela metade; o antigo só é
+    apagado depois da troca.
+    """
+    import shutil
+
+    descricoes = dados["DESCRICAO"].tolist()
+    descricoes_bytes = [d.encode("utf-8") for d in descricoes]
+    offsets = np.zeros(len(descricoes_bytes) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in descricoes_bytes], out=offsets[1:])
+
+    codigo = dados["CODIGO"].to_numpy(dtype=np.int64)
+    um_codigos, um_categorias = _categorizar(dados["UM"].tolist(), str)
+    familia_codigos, familia_categorias = _categorizar(dados["FAMILIA"].tolist(), np.int64)
+
+    colunas = {
+        "codigo": codigo,
+        "codigo_ordem": np.argsort(codigo, kind="stable"),
+        "descricao_dados": np.frombuffer(b"".join(descricoes_bytes), dtype=np.uint8),
+        "descricao_offsets": offsets,
+        "um_codigos": um_codigos,
+        "um_categorias": um_categorias,
+        "familia_codigos": familia_codigos,
+        "familia_categorias": familia_categorias,
+    }
+
+    temporario = f"{diretorio}.tmp"
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+    for nome, array in colunas.items():
+        np.save(os.path.join(temporario, f"{nome}.npy"), array, allow_pickle=False)
+
+    manifesto = {"linhas": len(descricoes), "hash": hash_descricoes(descricoes), "origem": origem}
+    with open(os.path.join(temporario, MANIFESTO), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+
+    antigo = f"{diretorio}.antigo"
+    shutil.rmtree(antigo, ignore_errors=True)
+    if os.path.exists(diretorio):
+        os.replace(diretorio, antigo)
+    os.replace(temporario, diretorio)
+    shutil.rmtree(antigo, ignore_errors=True)
+    return manifesto
+
+class Catalogo:
+    """
+    Catálogo de materiais compilado por 'compilar_catalogo.py'.
+    As colunas são abertas com mmap, então carregar o catálogo não lê os dados do disco;
+    apenas as linhas consultadas são decodificadas.
+    """
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        with open(os.path.join(diretorio, MANIFESTO), "r", encoding="utf-8") as f:
+            self.manifesto = json.load(f)
+
+        colunas = {
+            nome: np.load(os.path.join(diretorio, f"{nome}.npy"), mmap_mode="r", allow_pickle=False)
+            for nome in COLUNAS
+        }
+        self.codigo = colunas["codigo"]
+        self.codigo_ordem = colunas["codigo_ordem"]
+        self.descricao_dados = colunas["descricao_dados"]
+        self.descricao_offsets = colunas["descricao_offsets"]
+        self.um_codigos = colunas["um_codigos"]
+        self.familia_codigos = colunas["familia_codigos"]
+        # As categorias são pequenas: ficam inteiras em memória
+        self.um_categorias = np.array(colunas["um_categorias"])
+        self.familia_categorias = np.array(colunas["familia_categorias"])
+
+        if len(self.codigo) != self.linhas:
+            raise ValueError(
+                f"Catálogo '{diretorio}' inconsistente: manifesto indica {self.linhas} linhas, "
+                f"mas as colunas têm {len(self.codigo)}."
+            )
+
+    @property
+    def linhas(self):
+        return self.manifesto["linhas"]
+
+    @property
+    def hash(self):
+        return self.manifesto["hash"]
+
+    def __len__(self):
+        return self.linhas
+
+    def descricao(self, idx):
+        inicio, fim = self.descricao_offsets[idx], self.descricao_offsets[idx + 1]
+        return bytes(self.descricao_dados[inicio:fim]).decode("utf-8")
+
+    def descricoes(self):
+        return [self.descricao(i) for i in range(self.linhas)]
+
+    def linha(self, idx):
+        """Retorna o material da linha idx com tipos nativos do Python."""
+        return {
+            "CODIGO": int(self.codigo[idx]),
+            "DESCRICAO": self.descricao(idx),
+            "UM": str(self.um_categorias[self.um_codigos[idx]]),
+            "FAMILIA": int(self.familia_categorias[self.familia_codigos[idx]]),
+        }
+
+    def indice_por_codigo(self, codigo):
+        """Retorna a linha do material com o CODIGO informado, ou None se não existir."""
+        posicao = np.searchsorted(self.codigo, codigo, sorter=self.codigo_ordem)
+        if posicao < self.linhas:
+            idx = int(self.codigo_ordem[posicao])
+            if self.codigo[idx] == codigo:
+                return idx
+        return None
+
+    def verificar_embeddings(self, embeddings, meta=None):
+        """
+        Confere se os embeddings foram gerados a partir deste catálogo.
+        Lança ValueError se o número de linhas ou o hash não baterem.
+        """
+        if embeddings.shape[0] != self.linhas:
+            raise ValueError(
+                f"O catálogo tem {self.linhas} linhas, mas os embeddings têm {embeddings.shape[0]}. "
+                "Execute 'gerar_embeddings.py' novamente."
+            )
+        if meta is not None and meta.get("hash_catalogo") != self.hash:
+            raise ValueError(
+                "Os embeddings foram gerados a partir de outra versão do catálogo. "
+                "Execute 'gerar_embeddings.py' novamente."
+            )
@@ -23,7 +23,9 @@ def retreinar_modelo_task():
         from .retreinar_com_feedback import retreinar_modelo_ner
 
         logging.info("Worker Celery: Tarefa de retreinamento recebida. Iniciando processo.")
-        retreinar_modelo_ner(model_manager)
+        # Parte sempre da versão em uso, e não de um candidato ainda não promovido
+        model_manager.load_model()
+        retreinar_modelo_ner(model_manager.get_model())
         logging.info("Worker Celery: Processo de retreinamento concluído com sucesso.")
     except Exception as e:
         logging.error(f"Worker Celery: Erro durante o retreinamento: {e}")
\ No newline at end of file
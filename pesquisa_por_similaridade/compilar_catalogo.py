@@ -0,0 +1,57 @@
+import pandas as pd
+import logging
+import sys
+from catalogo import salvar_catalogo
+
+# Configuração do logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Caminhos dos arquivos
+CSV_PATH = "./pesquisa_por_similaridade/materiais.csv"
+CATALOGO_DIR = "./pesquisa_por_similaridade/catalogo"
+
+def compilar_catalogo():
+    """
+    Converte o CSV de materiais, uma única vez, para o catálogo colunar lido pela API.
+    Linhas mal formadas interrompem a compilação em vez de serem descartadas,
+    pois isso desalinharia o catálogo dos embeddings.
+    """
+    logging.info(f"Compilando o catálogo a partir de '{CSV_PATH}'...")
+
+    try:
+        dados = pd.read_csv(
+            CSV_PATH,
+            sep=";",
+            encoding="ISO-8859-1",
+            usecols=["CODIGO", "DESCRICAO", "UM", "FAMILIA"],
+            dtype=str,
+            keep_default_na=False,
+            on_bad_lines="error"
+        )
+    except FileNotFoundError:
+        logging.error(f"Erro: O arquivo '{CSV_PATH}' não foi encontrado.")
+        return False
+    except pd.errors.ParserError as e:
+        logging.error(f"Linha mal formada no CSV, corrija o arquivo antes de compilar: {e}")
+        return False
+
+    try:
+        dados["CODIGO"] = pd.to_numeric(dados["CODIGO"].str.strip(), errors="raise").astype("int64")
+    except ValueError as e:
+        logging.error(f"CODIGO inválido no CSV: {e}")
+        return False
+
+    # Família ausente ou inválida vira -1, para não casar com nenhuma busca
+    dados["FAMILIA"] = pd.to_numeric(dados["FAMILIA"].str.strip(), errors="coerce").fillna(-1).astype("int64")
+    dados["UM"] = dados["UM"].str.strip()
+
+    duplicados = dados["CODIGO"].duplicated().sum()
+    if duplicados:
+        logging.warning(f"{duplicados} CODIGO(s) repetido(s) no CSV; a busca por código retornará a primeira linha.")
+
+    manifesto = salvar_catalogo(dados, CATALOGO_DIR, origem=CSV_PATH)
+    logging.info(f"Catálogo com {manifesto['linhas']} materiais salvo em '{CATALOGO_DIR}' (hash {manifesto['hash'][:12]}).")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if compilar_catalogo() else 1)
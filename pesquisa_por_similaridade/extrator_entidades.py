@@ -0,0 +1,112 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Frases no formato dos exemplos de 'dados_treino.py'. Quando a mensagem segue um
+# desses modelos, as três entidades saem direto da regex, sem passar pelo spaCy.
+TEMPLATES = [
+    r"procure por um material com a descri[çc][ãa]o (?P<DESCRICAO>.+?),? com UM (?P<UM>[^\s,;.]+) e fam[íi]lia (?P<FAMILIA>\d{6})",
+    r"preciso de (?P<DESCRICAO>.+?),? com a unidade de medida (?P<UM>[^\s,;.]+) e da fam[íi]lia (?P<FAMILIA>\d{6})",
+    r"voc[êe] poderia procurar (?P<DESCRICAO>.+?)\?? unidade de medida (?P<UM>[^\s,;.]+),? fam[íi]lia (?P<FAMILIA>\d{6})",
+    r"busco por (?P<DESCRICAO>.+?),? UM (?P<UM>[^\s,;.]+),? fam[íi]lia (?P<FAMILIA>\d{6})",
+    r"queria encontrar um material com a descri[çc][ãa]o (?P<DESCRICAO>.+?),? UM (?P<UM>[^\s,;.]+) e fam[íi]lia (?P<FAMILIA>\d{6})",
+]
+TEMPLATES_COMPILADOS = [re.compile(rf"\s*{t}\s*[.!]?\s*", re.IGNORECASE) for t in TEMPLATES]
+
+# "UM" só é aceito em maiúsculas, para não confundir com o artigo "um". O código da
+# unidade vem do vocabulário do catálogo (ver ExtratorEntidades._compilar_regex_um).
+PREFIXO_UM = r"(?:\bUM\b|(?i:\bunidade de medida\b))\s*:?\s*"
+REGEX_FAMILIA = re.compile(r"\b(?P<FAMILIA>\d{6})\b")
+
+class ExtratorEntidades:
+    """
+    Extrai DESCRICAO, UM e FAMILIA de uma mensagem do chat.
+    UM e FAMILIA são reconhecidas por regras a partir do vocabulário do catálogo;
+    o modelo estatístico só é usado para a DESCRICAO, e apenas quando a mensagem
+    não segue nenhum dos modelos de frase conhecidos.
+    """
+    def __init__(self, ums, familias, tamanho_cache=1024):
+        self.ums = {str(um).upper(): str(um) for um in ums}
+        self.familias = {str(familia) for familia in familias}
+        self.regex_um = self._compilar_regex_um()
+        self.tamanho_cache = tamanho_cache
+        self._cache = OrderedDict()
+        self._versao_cache = None
+        self._lock = threading.Lock()
+
+    def extrair(self, mensagem, nlp, versao_modelo=0):
+        """
+        Retorna um dicionário {rótulo: texto} com as entidades encontradas.
+        O resultado fica em cache até o ModelManager trocar de modelo (versao_modelo).
+        """
+        chave = mensagem.strip()
+        with self._lock:
+            if self._versao_cache != versao_modelo:
+                self._cache.clear()
+                self._versao_cache = versao_modelo
+            if chave in self._cache:
+                self._cache.move_to_end(chave)
+                return dict(self._cache[chave])
+
+        entidades = self._extrair_sem_cache(chave, nlp)
+
+        with self._lock:
+            if self._versao_cache == versao_modelo:
+                self._cache[chave] = entidades
+                if len(self._cache) > self.tamanho_cache:
+                    self._cache.popitem(last=False)
+        return dict(entidades)
+
+    def _compilar_regex_um(self):
+        """Regex com as UMs do catálogo (as mais longas primeiro, para 'M2' não virar 'M')."""
+        if not self.ums:
+            return None
+        alternativas = "|".join(re.escape(um) for um in sorted(self.ums, key=len, reverse=True))
+        return re.compile(rf"{PREFIXO_UM}(?P<UM>(?i:{alternativas}))(?!\w)")
+
+    def _extrair_sem_cache(self, mensagem, nlp):
+        for template in TEMPLATES_COMPILADOS:
+            match = template.fullmatch(mensagem)
+            if match:
+                # UM e FAMILIA passam pelo mesmo vocabulário das regras abaixo
+                entidades = {"DESCRICAO": match.group("DESCRICAO").strip()}
+                um = self.ums.get(match.group("UM").upper())
+                if um:
+                    entidades["UM"] = um
+                if match.group("FAMILIA") in self.familias:
+                    entidades["FAMILIA"] = match.group("FAMILIA")
+                return entidades
+
+        if nlp is None:
+            raise RuntimeError("Modelo de linguagem não carregado.")
+
+        doc = nlp(mensagem)
+        entidades_modelo = {ent.label_: ent.text for ent in doc.ents}
+
+        entidades = {}
+        if "DESCRICAO" in entidades_modelo:
+            entidades["DESCRICAO"] = entidades_modelo["DESCRICAO"]
+
+        # As regras têm prioridade; o modelo só cobre UM/FAMILIA fora do vocabulário
+        um = self._extrair_um(mensagem) or entidades_modelo.get("UM")
+        if um:
+            entidades["UM"] = um
+        familia = self._extrair_familia(mensagem) or entidades_modelo.get("FAMILIA")
+        if familia:
+            entidades["FAMILIA"] = familia
+        return entidades
+
+    def _extrair_um(self, mensagem):
+        if self.regex_um is None:
+            return None
+        for match in self.regex_um.finditer(mensagem):
+            um = self.ums.get(match.group("UM").upper())
+            if um:
+                return um
+        return None
+
+    def _extrair_familia(self, mensagem):
+        for match in REGEX_FAMILIA.finditer(mensagem):
+            if match.group("FAMILIA") in self.familias:
+                return match.group("FAMILIA")
+        return None
@@ -1,46 +1,58 @@
-import pandas as pd
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import logging
+import json
+import os
+from catalogo import Catalogo
+from versionamento import repositorio_indice
 
 # Configuração do logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Caminhos dos arquivos
-CSV_PATH = "./pesquisa_por_similaridade/materiais.csv"
-EMBEDDINGS_PATH = "embeddings.npy"
+CATALOGO_DIR = "./pesquisa_por_similaridade/catalogo"
 MODELO_NOME = 'all-MiniLM-L6-v2'
 
 def gerar_e_salvar_embeddings():
     """
-    Carrega os materiais do CSV, gera os embeddings das descrições e salva em um arquivo.
+    Carrega os materiais do catálogo compilado, gera os embeddings das descrições e salva em um arquivo.
     """
     logging.info("Iniciando a geração de embeddings...")
-    
+
     try:
-        dados = pd.read_csv(
-            CSV_PATH, sep=";", encoding="ISO-8859-1", usecols=["DESCRICAO"]
-        )
-        logging.info(f"{len(dados)} materiais carregados de '{CSV_PATH}'.")
+        catalogo = Catalogo(CATALOGO_DIR)
+        logging.info(f"{len(catalogo)} materiais carregados de '{CATALOGO_DIR}'.")
     except FileNotFoundError:
-        logging.error(f"Erro: O arquivo '{CSV_PATH}' não foi encontrado.")
+        logging.error(f"Erro: O catálogo '{CATALOGO_DIR}' não foi encontrado.")
+        logging.error("Execute o script 'compilar_catalogo.py' primeiro.")
         return
 
-    # Garante que todas as descrições sejam strings
-    descricoes = dados['DESCRICAO'].fillna('').astype(str).tolist()
-    
+    descricoes = catalogo.descricoes()
+
     logging.info(f"Carregando o modelo de sentence-transformer: '{MODELO_NOME}'...")
     # O modelo será baixado automaticamente na primeira vez que for usado
     model = SentenceTransformer(MODELO_NOME)
-    
+
     logging.info("Gerando embeddings para as descrições... (Isso pode levar alguns minutos)")
     embeddings = model.encode(descricoes, show_progress_bar=True)
-    
+
     logging.info(f"Embeddings gerados com sucesso. Shape: {embeddings.shape}")
-    
+
+    # Cada geração vira uma nova versão do índice; a versão em uso nunca é sobrescrita
+    repositorio = repositorio_indice()
+    versao, diretorio = repositorio.nova_versao()
+
     # Salva os embeddings em um arquivo .npy para acesso rápido
-    np.save(EMBEDDINGS_PATH, embeddings)
-    logging.info(f"Embeddings salvos em '{EMBEDDINGS_PATH}'.")
+    np.save(os.path.join(diretorio, "embeddings.npy"), embeddings)
+
+    # Registra de qual catálogo os embeddings vieram, para a API conferir o alinhamento
+    meta = {"linhas": len(catalogo), "hash_catalogo": catalogo.hash, "modelo": MODELO_NOME}
+    with open(os.path.join(diretorio, "embeddings.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    logging.info(f"Embeddings salvos em '{diretorio}'.")
+
+    repositorio.promover(versao)
+    logging.info(f"Versão '{versao}' do índice promovida. Use POST /modelos/indice/recarregar para aplicá-la na API em execução.")
 
 if __name__ == "__main__":
-    gerar_e_salvar_embeddings()
\ No newline at end of file
+    gerar_e_salvar_embeddings()
@@ -0,0 +1,66 @@
+import numpy as np
+import logging
+import json
+import os
+import shutil
+import time
+from grafo_vizinhos import construir_grafo, salvar_grafo
+from versionamento import repositorio_indice
+
+# Configuração do logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+K_VIZINHOS = 32
+
+def _vincular(origem, destino):
+    """Reaproveita um arquivo de outra versão (hard link, ou cópia se não for possível)."""
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copy2(origem, destino)
+
+def gerar_e_salvar_grafo(k=K_VIZINHOS):
+    """
+    Carrega os embeddings do catálogo, calcula os k vizinhos mais parecidos de cada
+    material e salva o grafo para as buscas "similares ao CODIGO".
+    As versões do índice são imutáveis: o grafo vai para uma nova versão, com os
+    mesmos embeddings da versão em uso, que é promovida ao final.
+    """
+    logging.info("Iniciando a geração do grafo de vizinhos...")
+
+    repositorio = repositorio_indice()
+    indice_dir = repositorio.caminho_atual()
+    embeddings_path = os.path.join(indice_dir, "embeddings.npy")
+    meta_path = os.path.join(indice_dir, "embeddings.json")
+
+    try:
+        embeddings = np.load(embeddings_path)
+        logging.info(f"Embeddings carregados de '{embeddings_path}'. Shape: {embeddings.shape}")
+    except FileNotFoundError:
+        logging.error(f"Erro: O arquivo '{embeddings_path}' não foi encontrado.")
+        logging.error("Execute o script 'gerar_embeddings.py' primeiro.")
+        return
+
+    hash_catalogo = None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            hash_catalogo = json.load(f).get("hash_catalogo")
+
+    inicio = time.time()
+    ids, scores = construir_grafo(embeddings, k=k)
+    logging.info(f"Grafo com {ids.shape[1]} vizinhos por material calculado em {time.time() - inicio:.2f}s.")
+
+    versao, grafo_dir = repositorio.nova_versao()
+    for caminho in (embeddings_path, meta_path):
+        if os.path.exists(caminho):
+            _vincular(caminho, os.path.join(grafo_dir, os.path.basename(caminho)))
+
+    meta = {"linhas": int(ids.shape[0]), "k": int(ids.shape[1]), "hash_catalogo": hash_catalogo}
+    salvar_grafo(grafo_dir, ids, scores, meta)
+    logging.info(f"Grafo de vizinhos salvo em '{grafo_dir}'.")
+
+    repositorio.promover(versao)
+    logging.info(f"Versão '{versao}' do índice promovida. Use POST /modelos/indice/recarregar para aplicá-la na API em execução.")
+
+if __name__ == "__main__":
+    gerar_e_salvar_grafo()
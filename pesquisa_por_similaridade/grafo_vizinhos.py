@@ -0,0 +1,111 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Arquivos do grafo de vizinhos (ids int32 + scores float16, uma linha por material)
+GRAFO_IDS = "vizinhos_ids.npy"
+GRAFO_SCORES = "vizinhos_scores.npy"
+GRAFO_META = "vizinhos.json"
+
+# Limite aproximado de memória para as matrizes de similaridade calculadas ao mesmo tempo
+ORCAMENTO_MEMORIA_BYTES = 1 << 30
+
+def _vizinhos_do_bloco(normalizados, inicio, fim, k, ids, scores):
+    """Calcula os k vizinhos mais próximos das linhas [inicio, fim) e grava em ids/scores."""
+    sims = normalizados[inicio:fim] @ normalizados.T
+    # Remove o próprio material da lista de vizinhos
+    sims[np.arange(fim - inicio), np.arange(inicio, fim)] = -np.inf
+
+    candidatos = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    candidatos_scores = np.take_along_axis(sims, candidatos, axis=1)
+    ordem = np.argsort(-candidatos_scores, axis=1)
+
+    ids[inicio:fim] = np.take_along_axis(candidatos, ordem, axis=1)
+    scores[inicio:fim] = np.take_along_axis(candidatos_scores, ordem, axis=1)
+
+def construir_grafo(embeddings, k=32, tamanho_bloco=None, workers=None):
+    """
+    Constrói o grafo k-NN (similaridade de cosseno) sobre todo o catálogo.
+    As linhas são processadas em blocos, com um produto de matrizes por bloco, distribuídos
+    entre threads (o NumPy libera o GIL durante o cálculo).
+    Retorna (ids int32, scores float16), ambos com shape (linhas, k).
+    """
+    normalizados = np.asarray(embeddings, dtype=np.float32)
+    normalizados = normalizados / np.maximum(np.linalg.norm(normalizados, axis=1, keepdims=True), 1e-12)
+
+    linhas = normalizados.shape[0]
+    k = min(k, linhas - 1)
+    ids = np.zeros((linhas, max(k, 0)), dtype=np.int32)
+    scores = np.zeros((linhas, max(k, 0)), dtype=np.float16)
+    if k <= 0:
+        return ids, scores
+
+    workers = workers or os.cpu_count() or 1
+    if tamanho_bloco is None:
+        # Cada bloco gera uma matriz (tamanho_bloco x linhas) de float32
+        tamanho_bloco = max(1, min(1024, ORCAMENTO_MEMORIA_BYTES // (4 * linhas * workers)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        tarefas = [
+            executor.submit(_vizinhos_do_bloco, normalizados, inicio, min(inicio + tamanho_bloco, linhas), k, ids, scores)
+            for inicio in range(0, linhas, tamanho_bloco)
+        ]
+        for tarefa in tarefas:
+            tarefa.result()
+
+    return ids, scores
+
+def _gravar_e_trocar(caminho, gravar):
+    """Grava em um arquivo temporário e o coloca no lugar com os.replace."""
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "wb") as f:
+        gravar(f)
+    os.replace(temporario, caminho)
+
+def salvar_grafo(diretorio, ids, scores, meta):
+    """
+    Grava o grafo sem sobrescrever os arquivos no lugar: quem já os tem abertos com mmap
+    continua lendo a versão anterior até reabri-los.
+    """
+    _gravar_e_trocar(os.path.join(diretorio, GRAFO_IDS), lambda f: np.save(f, ids))
+    _gravar_e_trocar(os.path.join(diretorio, GRAFO_SCORES), lambda f: np.save(f, scores))
+    _gravar_e_trocar(
+        os.path.join(diretorio, GRAFO_META),
+        lambda f: f.write(json.dumps(meta, indent=2).encode("utf-8"))
+    )
+
+class GrafoVizinhos:
+    """Grafo k-NN pré-calculado por 'gerar_grafo_vizinhos.py', aberto com mmap."""
+    def __init__(self, diretorio):
+        with open(os.path.join(diretorio, GRAFO_META), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.ids = np.load(os.path.join(diretorio, GRAFO_IDS), mmap_mode="r")
+        self.scores = np.load(os.path.join(diretorio, GRAFO_SCORES), mmap_mode="r")
+
+    @property
+    def k(self):
+        return self.ids.shape[1]
+
+    def vizinhos(self, idx, top_n=None):
+        """Retorna a lista de hits ({'corpus_id', 'score'}) do material da linha idx."""
+        top_n = self.k if top_n is None else min(top_n, self.k)
+        return [
+            {"corpus_id": int(vizinho), "score": float(score)}
+            for vizinho, score in zip(self.ids[idx, :top_n], self.scores[idx, :top_n])
+        ]
+
+    def verificar_catalogo(self, catalogo):
+        """Lança ValueError se o grafo não tiver sido gerado a partir deste catálogo."""
+        if self.ids.shape[0] != len(catalogo):
+            raise ValueError(
+                f"O catálogo tem {len(catalogo)} linhas, mas o grafo de vizinhos tem {self.ids.shape[0]}. "
+                "Execute 'gerar_grafo_vizinhos.py' novamente."
+            )
+        hash_grafo = self.meta.get("hash_catalogo")
+        if hash_grafo is not None and hash_grafo != catalogo.hash:
+            raise ValueError(
+                "O grafo de vizinhos foi gerado a partir de outra versão do catálogo. "
+                "Execute 'gerar_grafo_vizinhos.py' novamente."
+            )
@@ -1,20 +1,30 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Security
+import time
+
+# Marca o início da importação para medir o custo de subir a API (ver /health)
+_inicio_importacao = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, status, Security, UploadFile, File, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
-from pydantic import BaseModel
-import pandas as pd
+from pydantic import BaseModel, Field
 import os
-import spacy
 import logging
 import json
 import re
+import shutil
+import tempfile
 from typing import List
-from spacy.training import Example
-import random
 import threading
 from dotenv import load_dotenv
 from .buscar_parecidos import buscar_parecidos_semantico as buscar_parecidos
-from .retreinar_com_feedback import retreinar_modelo_ner
-from .celery_worker import retreinar_modelo_task
+from .buscar_parecidos import buscar_parecidos_semantico_lote as buscar_parecidos_lote
+from .buscar_parecidos import buscar_similares_por_indice
+from .buscar_parecidos import configurar_busca_fragmentada, caminho_embeddings, recarregar_indice, diretorio_indice_em_uso
+from .buscar_parecidos import carregar_recursos_semanticos, recursos_semanticos_prontos, verificar_alinhamento
+from .versionamento import repositorio_indice, repositorio_ner
+from .avaliacao_sombra import AvaliadorSombra
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -56,63 +66,293 @@ async def validar_token_api(token: str = Security(oauth2_scheme)):
     return True 
 
 # --- Caminhos ---
-MODEL_PATH = "./pesquisa_por_similaridade/treinamento_chat/treinamento_chat_materiais"
+# O modelo NER e o índice de embeddings são versionados (ver versionamento.py):
+# o diretório em uso é lido do manifesto de cada um a cada (re)carregamento.
 FEEDBACK_NER_FILE = "./pesquisa_por_similaridade/treinamento_chat/dados_aprendizado.jsonl" 
-CSV_PATH = "./pesquisa_por_similaridade/materiais.csv"
+CATALOGO_DIR = "./pesquisa_por_similaridade/catalogo"
+
+# --- Busca fragmentada ---
+# Número de processos entre os quais o índice de embeddings é dividido (0 desativa)
+BUSCA_FRAGMENTOS = int(os.getenv("BUSCA_FRAGMENTOS", "0"))
+# Critério de partição: "linhas" (faixas contíguas) ou "familia"
+BUSCA_PARTICAO = os.getenv("BUSCA_PARTICAO", "linhas")
+
+# --- Modo sombra e critérios de promoção do modelo NER candidato ---
+# Fração das mensagens do /chat também processadas pelo candidato, em segundo plano
+SOMBRA_FRACAO = float(os.getenv("SOMBRA_FRACAO", "0.1"))
+SOMBRA_MIN_AMOSTRAS = int(os.getenv("SOMBRA_MIN_AMOSTRAS", "50"))
+SOMBRA_MIN_CONCORDANCIA = float(os.getenv("SOMBRA_MIN_CONCORDANCIA", "0.9"))
+# Latência p95 máxima do candidato, relativa à do modelo atual
+SOMBRA_MAX_RAZAO_LATENCIA = float(os.getenv("SOMBRA_MAX_RAZAO_LATENCIA", "1.5"))
+
+# --- Busca em lote ---
+# O primeiro bloco é pequeno para que as primeiras respostas cheguem rápido ao cliente
+TAMANHO_PRIMEIRO_LOTE = 32
+# Limite do bloco, para a memória usada não depender do tamanho do arquivo enviado
+MAX_TAMANHO_LOTE = 2048
 
 # --- Carregamento de Dados e Modelos ---
-try:
-    dados = pd.read_csv(
-        CSV_PATH,
-        sep=";",
-        encoding="ISO-8859-1",
-        usecols=["CODIGO", "DESCRICAO", "UM", "FAMILIA"],
-        on_bad_lines="skip"
-    )
-    logging.info("Base de dados 'materiais.csv' carregada com sucesso.")
-except Exception as e:
-    logging.error(f"Erro ao carregar CSV 'materiais.csv': {e}")
-    dados = pd.DataFrame(columns=["CODIGO", "DESCRICAO", "UM", "FAMILIA"])
+# Nada pesado é carregado na importação do módulo: os recursos são carregados em
+# segundo plano pelo lifespan da API ou sob demanda, na primeira vez que forem usados.
+class CatalogoManager:
+    def __init__(self, catalogo_dir):
+        self.catalogo_dir = catalogo_dir
+        self.catalogo = None
+        self.extrator = None
+        self.alinhado = False
+        # Indica se o alinhamento já foi conferido (com sucesso ou não)
+        self.verificado = False
+        self._lock = threading.Lock()
+
+    def load_data(self):
+        from .catalogo import Catalogo
+        from .extrator_entidades import ExtratorEntidades
+
+        with self._lock:
+            if self.catalogo is not None:
+                return
+            try:
+                self.catalogo = Catalogo(self.catalogo_dir)
+                # O vocabulário de UM e FAMILIA do catálogo alimenta as regras de extração do /chat
+                self.extrator = ExtratorEntidades(self.catalogo.um_categorias, self.catalogo.familia_categorias)
+                logging.info(f"Catálogo com {len(self.catalogo)} materiais carregado com sucesso.")
+            except FileNotFoundError:
+                logging.error(f"Catálogo '{self.catalogo_dir}' não encontrado. Execute o script 'compilar_catalogo.py' primeiro.")
+            except Exception as e:
+                logging.error(f"Erro ao carregar o catálogo: {e}")
+
+    def get_catalogo(self):
+        if self.catalogo is None:
+            self.load_data()
+        return self.catalogo
+
+    def get_extrator(self):
+        if self.catalogo is None:
+            self.load_data()
+        return self.extrator
+
+    def is_loaded(self):
+        return self.catalogo is not None
+
+    def verificar_alinhamento(self):
+        """Confere se o catálogo e os embeddings vieram da mesma base."""
+        try:
+            verificar_alinhamento(self.catalogo)
+            self.alinhado = True
+        except Exception as e:
+            logging.error(f"Catálogo e embeddings desalinhados: {e}")
+            self.alinhado = False
+        self.verificado = True
+        return self.alinhado
+
+catalogo_manager = CatalogoManager(CATALOGO_DIR)
+
+# --- Grafo de vizinhos (opcional, gerado por 'gerar_grafo_vizinhos.py') ---
+# O grafo é gravado junto da versão do índice da qual ele deriva.
+class GrafoManager:
+    def __init__(self, repositorio):
+        self.repositorio = repositorio
+        self.grafo = None
+        self._lock = threading.Lock()
+
+    def _ler(self, grafo_dir):
+        from .grafo_vizinhos import GrafoVizinhos
+
+        try:
+            grafo = GrafoVizinhos(grafo_dir)
+            catalogo = catalogo_manager.get_catalogo()
+            if catalogo is not None:
+                grafo.verificar_catalogo(catalogo)
+            logging.info(f"Grafo de vizinhos carregado ({grafo.k} vizinhos por material).")
+            return grafo
+        except FileNotFoundError:
+            logging.warning("Grafo de vizinhos não encontrado. Execute o script 'gerar_grafo_vizinhos.py' para habilitar /similares.")
+        except Exception as e:
+            logging.error(f"Erro ao carregar o grafo de vizinhos: {e}")
+        return None
+
+    def load_grafo(self):
+        with self._lock:
+            if self.grafo is not None:
+                return
+            self.grafo = self._ler(self.repositorio.caminho_atual())
+
+    def recarregar(self, grafo_dir):
+        """Troca o grafo pelo de outra versão do índice (ou o remove, se ela não tiver um)."""
+        grafo = self._ler(grafo_dir)
+        with self._lock:
+            self.grafo = grafo
+
+    def get_grafo(self):
+        if self.grafo is None:
+            self.load_grafo()
+        return self.grafo
+
+grafo_manager = GrafoManager(repositorio_indice())
+
+# --- Índice fragmentado (opcional, habilitado por BUSCA_FRAGMENTOS) ---
+class FragmentosManager:
+    def __init__(self, fragmentos, particao):
+        self.fragmentos = fragmentos
+        self.particao = particao
+        self.indice = None
+
+    def is_enabled(self):
+        return self.fragmentos > 0
+
+    def iniciar(self, embeddings_path=None):
+        """
+        Sobe os processos dos fragmentos. Se já houver um índice ativo (troca de versão),
+        ele continua atendendo até o novo estar pronto e só então é encerrado.
+        """
+        from .busca_fragmentada import IndiceFragmentado
+
+        catalogo = catalogo_manager.get_catalogo()
+        if catalogo is None:
+            logging.error("Busca fragmentada não iniciada: catálogo não carregado.")
+            return
+        try:
+            indice = IndiceFragmentado(
+                embeddings_path or caminho_embeddings(), catalogo, CATALOGO_DIR, self.fragmentos, self.particao
+            )
+            indice.iniciar()
+        except Exception as e:
+            logging.error(f"Erro ao iniciar a busca fragmentada: {e}")
+            return
+        anterior, self.indice = self.indice, indice
+        configurar_busca_fragmentada(indice)
+        if anterior is not None:
+            anterior.encerrar()
+
+    def encerrar(self):
+        if self.indice is not None:
+            configurar_busca_fragmentada(None)
+            self.indice.encerrar()
+            self.indice = None
+
+    def is_loaded(self):
+        return self.indice is not None and self.indice.prontos()
+
+fragmentos_manager = FragmentosManager(BUSCA_FRAGMENTOS, BUSCA_PARTICAO)
 
 # --- Gerenciador de Modelo ---
 class ModelManager:
-    def __init__(self, model_path):
-        self.model_path = model_path
+    def __init__(self, repositorio):
+        self.repositorio = repositorio
         self.nlp = None
-        self.load_model()
+        # Versão do manifesto em uso (None para o modelo legado, sem versionamento)
+        self.versao_modelo = None
+        # Incrementada a cada troca de modelo; invalida o cache de entidades do /chat
+        self.versao = 0
+        self._lock = threading.Lock()
+        # Protege só a troca de (nlp, versao), para as leituras não esperarem um spacy.load
+        self._troca_lock = threading.Lock()
+
+    def load_model(self, versao_modelo=None):
+        with self._lock:
+            return self._carregar(versao_modelo)
+
+    def _carregar(self, versao_modelo=None):
+        """
+        Carrega a versão informada ou, sem ela, a indicada no manifesto. O modelo novo
+        só substitui o anterior depois de carregado; se falhar, o anterior continua atendendo.
+        """
+        import spacy
 
-    def load_model(self):
+        if versao_modelo is None:
+            versao_modelo = self.repositorio.ler_manifesto()["atual"]
+        caminho = self.repositorio.caminho(versao_modelo) if versao_modelo else self.repositorio.legado
         try:
-            self.nlp = spacy.load(self.model_path)
-            logging.info("Modelo spaCy carregado/recarregado com sucesso.")
+            nlp = spacy.load(caminho)
         except Exception as e:
             logging.error(f"Erro ao carregar o modelo spaCy: {e}")
-            self.nlp = None
-    
+            return False
+        with self._troca_lock:
+            self.nlp = nlp
+            self.versao_modelo = versao_modelo
+            self.versao += 1
+        logging.info(f"Modelo spaCy (versão '{versao_modelo or 'legado'}') carregado/recarregado com sucesso.")
+        return True
+
     def get_model(self):
+        # Carrega sob demanda; se o carregamento em segundo plano já estiver em
+        # andamento, espera por ele em vez de carregar o modelo uma segunda vez.
+        if self.nlp is None:
+            with self._lock:
+                if self.nlp is None:
+                    self._carregar()
         return self.nlp
 
-model_manager = ModelManager(MODEL_PATH)
+    def get_model_versionado(self):
+        """Retorna (nlp, versao) do mesmo modelo, mesmo que ele seja trocado em seguida."""
+        self.get_model()
+        with self._troca_lock:
+            return self.nlp, self.versao
+
+    def is_loaded(self):
+        return self.nlp is not None
+
+model_manager = ModelManager(repositorio_ner())
+
+avaliador_sombra = AvaliadorSombra(model_manager.repositorio, fracao_amostra=SOMBRA_FRACAO)
+
+async def carregar_recursos():
+    """
+    Carrega catálogo, modelo NER e modelo semântico em paralelo, cada um em uma thread,
+    sem bloquear o event loop (a API já responde /health enquanto isso).
+    """
+    inicio = time.perf_counter()
+    await asyncio.gather(
+        asyncio.to_thread(catalogo_manager.get_catalogo),
+        asyncio.to_thread(model_manager.get_model),
+        asyncio.to_thread(carregar_recursos_semanticos),
+    )
+    if catalogo_manager.is_loaded() and recursos_semanticos_prontos():
+        catalogo_manager.verificar_alinhamento()
+    # O grafo é opcional e depende do catálogo: não entra no critério de prontidão
+    await asyncio.to_thread(grafo_manager.get_grafo)
+    if fragmentos_manager.is_enabled() and catalogo_manager.alinhado:
+        await asyncio.to_thread(fragmentos_manager.iniciar)
+    logging.info(f"Carregamento dos recursos concluído em {time.perf_counter() - inicio:.2f}s.")
 
-# Carrega o modelo de PLN na inicialização
-nlp = None
-try:
-    nlp = spacy.load(MODEL_PATH)
-    logging.info("Modelo spaCy carregado com sucesso.")
-except Exception as e:
-    logging.error(f"Erro ao carregar o modelo spaCy: {e}")
+def status_recursos():
+    recursos = {
+        "catalogo": catalogo_manager.is_loaded(),
+        "modelo_ner": model_manager.is_loaded(),
+        "modelo_semantico": recursos_semanticos_prontos(),
+        "alinhamento": catalogo_manager.alinhado,
+    }
+    if fragmentos_manager.is_enabled():
+        recursos["busca_fragmentada"] = fragmentos_manager.is_loaded()
+    return recursos
 
 # Lock para controlar o acesso ao processo de retreinamento
 retraining_lock = threading.Lock()
 
+# Serializa as trocas de versão do índice (recarregar e rollback)
+troca_indice_lock = threading.Lock()
+
 # --- Classes---
+# Limite de resultados por página nas buscas paginadas
+MAX_TOP_N = 50
+# Toda página é recortada do mesmo conjunto de resultados, ordenado da mesma forma
+# qualquer que seja o offset; assim as páginas não repetem nem pulam materiais.
+LIMITE_PAGINACAO = 2 * MAX_TOP_N
+# Hits semânticos que recebem o bônus de UM/FAMILIA e são reordenados. É o mesmo em
+# /buscar, /chat e /buscar-lote (com ou sem fragmentos), e cobre todas as páginas.
+CANDIDATOS_BUSCA = LIMITE_PAGINACAO
+
 class Material(BaseModel):
     descricao: str
     um: str
     familia: int
+    top_n: int = Field(5, ge=1, le=MAX_TOP_N)
+    offset: int = Field(0, ge=0, lt=LIMITE_PAGINACAO)
 
 class ChatMessage(BaseModel):
     mensagem: str
+    top_n: int = Field(5, ge=1, le=MAX_TOP_N)
+    offset: int = Field(0, ge=0, lt=LIMITE_PAGINACAO)
 
 class EntidadeCorrigida(BaseModel):
     descricao: str
@@ -123,54 +363,239 @@ class FeedbackNER(BaseModel):
     entidades_corretas: List[EntidadeCorrigida]
 
 # --- Inicialização da API ---
-app = FastAPI(title="API de Materiais", version="1.3-secure")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tarefa_carregamento = asyncio.create_task(carregar_recursos())
+    yield
+    tarefa_carregamento.cancel()
+    await asyncio.to_thread(fragmentos_manager.encerrar)
+
+app = FastAPI(title="API de Materiais", version="1.3-secure", lifespan=lifespan)
+
+def _validar_pagina(top_n, offset):
+    if offset + top_n > LIMITE_PAGINACAO:
+        raise HTTPException(
+            status_code=400,
+            detail=f"offset + top_n não pode passar de {LIMITE_PAGINACAO} resultados."
+        )
+
+def _exigir_alinhamento():
+    """
+    As buscas só usam os embeddings depois de conferidos contra o catálogo (linhas e
+    hash); do contrário, o embedding i poderia apontar para o material errado.
+    Se o carregamento em segundo plano não chegou a conferir (ex.: o modelo semântico
+    falhou ao subir), os recursos são carregados sob demanda e conferidos aqui.
+    """
+    if not catalogo_manager.verificado and catalogo_manager.get_catalogo() is not None:
+        if carregar_recursos_semanticos():
+            catalogo_manager.verificar_alinhamento()
+    if not catalogo_manager.alinhado:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Catálogo e embeddings não conferidos ou de bases diferentes. Consulte /ready."
+        )
+
+def _paginar(resultados, top_n, offset):
+    """
+    Recorta a página [offset, offset + top_n) dos resultados. A busca sempre traz os
+    LIMITE_PAGINACAO primeiros, então todas as páginas saem da mesma ordenação.
+    """
+    pagina = resultados.iloc[offset:offset + top_n].to_dict(orient="records")
+    return pagina, len(resultados) > offset + top_n
 
 # --- Endpoint raiz ---
 @app.get("/")
 def raiz():
     return {"status": "ok", "mensagem": "API de Materiais funcionando!"}
 
+# --- Endpoints de saúde (liveness) e prontidão (readiness) ---
+@app.get("/health")
+def health():
+    return {"status": "ok", "tempo_importacao_s": round(TEMPO_IMPORTACAO, 3)}
+
+@app.get("/ready")
+def ready():
+    recursos = status_recursos()
+    if not all(recursos.values()):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "carregando", "recursos": recursos}
+        )
+    return {"status": "pronto", "recursos": recursos}
+
 # --- Endpoint para buscar semelhantes ---
 @app.post("/buscar", dependencies=[Depends(validar_token_api)])
 def buscar(material: Material):
-    if dados.empty:
+    catalogo = catalogo_manager.get_catalogo()
+    if catalogo is None or len(catalogo) == 0:
         raise HTTPException(status_code=500, detail="Base de dados não carregada corretamente.")
+    _exigir_alinhamento()
+    _validar_pagina(material.top_n, material.offset)
     try:
         resultados = buscar_parecidos(
             descricao_query=material.descricao, um=material.um, familia=material.familia,
-            dados=dados, top_n=5
+            catalogo=catalogo, top_n=LIMITE_PAGINACAO, candidatos=CANDIDATOS_BUSCA
         )
-        return {"entrada": material.dict(), "resultados": resultados.to_dict(orient="records")}
+        pagina, tem_mais = _paginar(resultados, material.top_n, material.offset)
+        return {"entrada": material.dict(), "resultados": pagina, "offset": material.offset, "tem_mais": tem_mais}
     except Exception as e:
         logging.error(f"Erro interno no endpoint /buscar: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+# --- Endpoint de reconstrução de um fragmento da busca ---
+@app.post("/fragmentos/{indice}/reconstruir", dependencies=[Depends(validar_token_api)])
+def reconstruir_fragmento(indice: int):
+    """Recarrega um fragmento do índice a partir do disco, sem parar os demais."""
+    if fragmentos_manager.indice is None:
+        raise HTTPException(status_code=400, detail="A busca fragmentada não está ativa.")
+    if not 0 <= indice < len(fragmentos_manager.indice.chaves):
+        raise HTTPException(status_code=404, detail=f"Fragmento {indice} não existe.")
+    try:
+        fragmentos_manager.indice.reconstruir_fragmento(indice)
+    except Exception as e:
+        logging.error(f"Erro ao reconstruir o fragmento {indice}: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao reconstruir o fragmento: {e}")
+    return {"status": "sucesso", "mensagem": f"Fragmento {indice} reconstruído."}
+
+# --- Endpoint de materiais similares a um CODIGO ---
+@app.get("/similares/{codigo}", dependencies=[Depends(validar_token_api)])
+def similares(codigo: int, top_n: int = Query(5, ge=1, le=MAX_TOP_N)):
+    catalogo = catalogo_manager.get_catalogo()
+    if catalogo is None or len(catalogo) == 0:
+        raise HTTPException(status_code=500, detail="Base de dados não carregada corretamente.")
+    grafo = grafo_manager.get_grafo()
+    if grafo is None:
+        raise HTTPException(status_code=503, detail="Grafo de vizinhos não disponível. Execute 'gerar_grafo_vizinhos.py'.")
+    if top_n > grafo.k:
+        raise HTTPException(status_code=400, detail=f"O grafo de vizinhos guarda só {grafo.k} vizinhos por material; use top_n <= {grafo.k}.")
+
+    idx = catalogo.indice_por_codigo(codigo)
+    if idx is None:
+        raise HTTPException(status_code=404, detail=f"Material com CODIGO {codigo} não encontrado.")
+
+    resultados = buscar_similares_por_indice(idx, catalogo, grafo, top_n=top_n)
+    return {"material": catalogo.linha(idx), "resultados": resultados}
+
+# --- Endpoint de busca em lote (upload de CSV) ---
+def _gerar_resultados_lote(caminho_csv, catalogo, top_n, sep, encoding, tamanho_lote):
+    """
+    Lê o CSV em blocos, busca cada bloco de uma vez e devolve uma linha NDJSON por material.
+    Só um bloco fica em memória por vez, independentemente do tamanho do arquivo.
+    """
+    import pandas as pd
+
+    linha = 0
+    try:
+        with pd.read_csv(caminho_csv, sep=sep, encoding=encoding, dtype=str,
+                         keep_default_na=False, iterator=True) as leitor:
+            tamanho = min(TAMANHO_PRIMEIRO_LOTE, tamanho_lote)
+            while True:
+                try:
+                    bloco = leitor.get_chunk(tamanho)
+                except StopIteration:
+                    break
+                tamanho = tamanho_lote
+
+                descricoes = bloco["DESCRICAO"].str.strip().tolist()
+                ums = bloco["UM"].str.strip().tolist() if "UM" in bloco else [""] * len(bloco)
+                if "FAMILIA" in bloco:
+                    familias = [
+                        int(f) if pd.notna(f) else None
+                        for f in pd.to_numeric(bloco["FAMILIA"].str.strip(), errors="coerce")
+                    ]
+                else:
+                    familias = [None] * len(bloco)
+
+                resultados = buscar_parecidos_lote(
+                    descricoes, ums, familias, catalogo, top_n=top_n, candidatos=CANDIDATOS_BUSCA
+                )
+
+                for descricao, um, familia, sugestoes in zip(descricoes, ums, familias, resultados):
+                    linha += 1
+                    registro = {
+                        "linha": linha,
+                        "entrada": {"DESCRICAO": descricao, "UM": um, "FAMILIA": familia},
+                        "resultados": sugestoes,
+                    }
+                    yield json.dumps(registro, ensure_ascii=False) + "\n"
+    except Exception as e:
+        logging.error(f"Erro na busca em lote após a linha {linha}: {e}")
+        yield json.dumps({"linha": linha + 1, "erro": str(e)}, ensure_ascii=False) + "\n"
+    finally:
+        os.remove(caminho_csv)
+
+@app.post("/buscar-lote", dependencies=[Depends(validar_token_api)])
+def buscar_lote(arquivo: UploadFile = File(...), top_n: int = Query(5, ge=1, le=MAX_TOP_N), sep: str = ";",
+                encoding: str = "ISO-8859-1", tamanho_lote: int = Query(256, ge=1, le=MAX_TAMANHO_LOTE)):
+    """
+    Recebe um CSV com as colunas DESCRICAO (obrigatória), UM e FAMILIA e devolve,
+    em streaming (NDJSON), os materiais mais parecidos para cada linha, à medida que
+    cada bloco é processado.
+    """
+    import pandas as pd
+
+    catalogo = catalogo_manager.get_catalogo()
+    if catalogo is None or len(catalogo) == 0:
+        raise HTTPException(status_code=500, detail="Base de dados não carregada corretamente.")
+    _exigir_alinhamento()
+
+    # O upload é copiado para um arquivo temporário próprio, pois o FastAPI fecha o
+    # UploadFile antes de a resposta em streaming terminar de ser enviada.
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as temporario:
+        shutil.copyfileobj(arquivo.file, temporario)
+
+    try:
+        colunas = pd.read_csv(temporario.name, sep=sep, encoding=encoding, nrows=0).columns
+    except Exception as e:
+        os.remove(temporario.name)
+        raise HTTPException(status_code=400, detail=f"Não foi possível ler o CSV: {e}")
+    if "DESCRICAO" not in colunas:
+        os.remove(temporario.name)
+        raise HTTPException(status_code=400, detail="O CSV precisa ter a coluna DESCRICAO.")
+
+    return StreamingResponse(
+        _gerar_resultados_lote(temporario.name, catalogo, top_n, sep, encoding, tamanho_lote),
+        media_type="application/x-ndjson"
+    )
+
 # --- Endpoint do chat ---
 @app.post("/chat", dependencies=[Depends(validar_token_api)])
 def chat(chat_message: ChatMessage):
-    if nlp is None:
-        raise HTTPException(status_code=500, detail="Modelo de linguagem não carregado.")
-    
-    doc = nlp(chat_message.mensagem)
-    entidades_extraidas = {ent.label_: ent.text for ent in doc.ents}
-    
+    extrator = catalogo_manager.get_extrator()
+    if extrator is None:
+        raise HTTPException(status_code=500, detail="Base de dados não carregada corretamente.")
+    _exigir_alinhamento()
+    _validar_pagina(chat_message.top_n, chat_message.offset)
+
+    nlp, versao_modelo = model_manager.get_model_versionado()
+    try:
+        entidades_extraidas = extrator.extrair(chat_message.mensagem, nlp, versao_modelo=versao_modelo)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # Uma amostra das mensagens também passa pelo modelo candidato, fora da requisição
+    avaliador_sombra.observar(chat_message.mensagem, nlp, extrator)
+
     if "DESCRICAO" not in entidades_extraidas:
         return {"status": "erro", "mensagem": "Não consegui identificar a descrição do material na sua mensagem."}
     
     try:
         familia_str = entidades_extraidas.get("FAMILIA")
         familia = int(familia_str) if familia_str else None
+        catalogo = catalogo_manager.get_catalogo()
         
         resultados = buscar_parecidos(
             descricao_query=entidades_extraidas.get("DESCRICAO"),
             um=entidades_extraidas.get("UM", ""), # Garante um valor padrão
             familia=familia,
-            dados=dados, 
-            top_n=5
+            catalogo=catalogo,
+            top_n=LIMITE_PAGINACAO,
+            candidatos=CANDIDATOS_BUSCA
         )
+        pagina, tem_mais = _paginar(resultados, chat_message.top_n, chat_message.offset)
         return {
             "status": "sucesso", "entrada_chat": chat_message.mensagem,
-            "entidades_extraidas": entidades_extraidas, "sugestoes": resultados.to_dict(orient="records")
+            "entidades_extraidas": entidades_extraidas, "sugestoes": pagina,
+            "offset": chat_message.offset, "tem_mais": tem_mais
         }
     except Exception as e:
         logging.error(f"Erro ao processar a requisição do chat: {e}")
@@ -200,6 +625,9 @@ def salvar_feedback_ner(feedback: FeedbackNER):
     novo_exemplo_treino = (texto, {"entities": entidades})
 
     try:
+        # Importado aqui para não carregar o Celery na inicialização da API
+        from .celery_worker import retreinar_modelo_task
+
         with open(FEEDBACK_NER_FILE, 'a', encoding='utf-8') as f:
             f.write(json.dumps(novo_exemplo_treino, ensure_ascii=False) + '\n')
         logging.info("Novo exemplo de treino adicionado. Enviando tarefa para a fila.")
@@ -210,3 +638,104 @@ def salvar_feedback_ner(feedback: FeedbackNER):
         return {"status": "sucesso", "mensagem": "Feedback recebido. O retreinamento foi agendado e ocorrerá em segundo plano."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao salvar ou agendar feedback: {e}")
+
+# --- Endpoints de versões do modelo NER e do índice ---
+def _trocar_indice(diretorio):
+    """
+    Aplica outra versão do índice sem derrubar a API: os embeddings são conferidos
+    contra o catálogo antes da troca e a busca fragmentada só muda quando os novos
+    fragmentos estiverem prontos. Lança ValueError se a versão não servir.
+    """
+    catalogo = catalogo_manager.get_catalogo()
+    if catalogo is None:
+        raise ValueError("Catálogo não carregado.")
+    with troca_indice_lock:
+        recarregar_indice(diretorio, catalogo)
+        catalogo_manager.alinhado = catalogo_manager.verificado = True
+        grafo_manager.recarregar(diretorio)
+        if fragmentos_manager.is_enabled():
+            fragmentos_manager.iniciar(caminho_embeddings(diretorio))
+
+@app.get("/modelos", dependencies=[Depends(validar_token_api)])
+def modelos():
+    """Versões em uso, histórico e candidato do modelo NER e do índice, com as métricas do modo sombra."""
+    manifesto = model_manager.repositorio.ler_manifesto()
+    aprovado, motivos = avaliador_sombra.avaliar_promocao(
+        manifesto.get("candidato"), SOMBRA_MIN_AMOSTRAS, SOMBRA_MIN_CONCORDANCIA, SOMBRA_MAX_RAZAO_LATENCIA
+    )
+    return {
+        "ner": {
+            "em_memoria": model_manager.versao_modelo,
+            "manifesto": manifesto,
+            "sombra": avaliador_sombra.metricas(),
+            "promocao": {"aprovado": aprovado, "motivos": motivos},
+        },
+        "indice": {
+            "em_memoria": diretorio_indice_em_uso(),
+            "manifesto": repositorio_indice().ler_manifesto(),
+        },
+    }
+
+@app.post("/modelos/ner/promover", dependencies=[Depends(validar_token_api)])
+def promover_modelo_ner(forcar: bool = False):
+    """
+    Promove o candidato se ele passou nos critérios do modo sombra (ou com forcar=true)
+    e o coloca em uso sem reiniciar a API. O manifesto só muda depois que o candidato
+    foi carregado, para a API e o manifesto nunca apontarem para versões diferentes.
+    """
+    repositorio = model_manager.repositorio
+    candidato = repositorio.ler_manifesto().get("candidato")
+    if candidato is None:
+        raise HTTPException(status_code=404, detail="Não há modelo candidato para promover.")
+
+    # As métricas precisam ser do mesmo candidato que será promovido
+    aprovado, motivos = avaliador_sombra.avaliar_promocao(
+        candidato, SOMBRA_MIN_AMOSTRAS, SOMBRA_MIN_CONCORDANCIA, SOMBRA_MAX_RAZAO_LATENCIA
+    )
+    if not aprovado and not forcar:
+        raise HTTPException(status_code=409, detail={"mensagem": "Candidato não aprovado.", "motivos": motivos})
+
+    if not model_manager.load_model(candidato):
+        raise HTTPException(status_code=500, detail=f"Não foi possível carregar a versão '{candidato}'; a anterior foi mantida.")
+    repositorio.promover(candidato)
+    avaliador_sombra.descartar_candidato()
+    return {"status": "sucesso", "mensagem": f"Modelo NER '{candidato}' em uso."}
+
+@app.post("/modelos/ner/rollback", dependencies=[Depends(validar_token_api)])
+def rollback_modelo_ner():
+    repositorio = model_manager.repositorio
+    anterior = repositorio.versao_anterior()
+    if anterior is None:
+        raise HTTPException(status_code=409, detail="Não há versão anterior para restaurar.")
+    # A versão anterior é carregada antes de o manifesto mudar, como no rollback do índice
+    if not model_manager.load_model(anterior):
+        raise HTTPException(status_code=500, detail=f"Não foi possível carregar a versão '{anterior}'; a atual foi mantida.")
+    versao = repositorio.rollback()
+    return {"status": "sucesso", "mensagem": f"Modelo NER '{versao}' restaurado."}
+
+@app.post("/modelos/indice/recarregar", dependencies=[Depends(validar_token_api)])
+def recarregar_indice_atual():
+    """Aplica a versão do índice promovida por 'gerar_embeddings.py'."""
+    repositorio = repositorio_indice()
+    try:
+        _trocar_indice(repositorio.caminho_atual())
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=409, detail=f"Versão do índice recusada; a anterior continua em uso: {e}")
+    return {"status": "sucesso", "mensagem": f"Índice '{repositorio.ler_manifesto()['atual']}' em uso."}
+
+@app.post("/modelos/indice/rollback", dependencies=[Depends(validar_token_api)])
+def rollback_indice():
+    repositorio = repositorio_indice()
+    anterior = repositorio.versao_anterior()
+    if anterior is None:
+        raise HTTPException(status_code=409, detail="Não há versão anterior para restaurar.")
+    # A versão anterior é conferida e carregada antes de o manifesto mudar
+    try:
+        _trocar_indice(repositorio.caminho(anterior))
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=409, detail=f"Versão '{anterior}' recusada: {e}")
+    repositorio.rollback()
+    return {"status": "sucesso", "mensagem": f"Índice '{anterior}' restaurado."}
+
+TEMPO_IMPORTACAO = time.perf_counter() - _inicio_importacao
+logging.info(f"Módulo da API importado em {TEMPO_IMPORTACAO:.3f}s.")
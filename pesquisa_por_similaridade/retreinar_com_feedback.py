@@ -1,60 +1,67 @@
-import os
 import logging
-import spacy
-import json
-from spacy.training import Example
 import random
-from pathlib import Path
+from spacy.tokens import DocBin
+from spacy.training import Corpus, Example
+from spacy.util import minibatch
+from .treinamento_chat.gerar_corpus import acumular_feedback, FEEDBACK_PATH, TREINO_PATH
+from .versionamento import repositorio_ner
 
-def retreinar_modelo_ner(nlp_instance):
+# Quantidade de exemplos do corpus original misturados ao feedback no re-treino,
+# para o modelo não esquecer o que já sabia
+EXEMPLOS_REVISAO = 500
+
+def _amostra_revisao(nlp, caminho, tamanho):
     """
-    Carrega o modelo spaCy, lê os novos dados de feedback e atualiza o componente NER.
+    Sorteia 'tamanho' exemplos de todo o DocBin. (O 'limit' do Corpus é aplicado antes
+    do 'shuffle', então devolveria sempre os mesmos primeiros documentos.)
     """
-    MODEL_PATH = "./pesquisa_por_similaridade/treinamento_chat/treinamento_chat_materiais"
-    FEEDBACK_NER_FILE = "./pesquisa_por_similaridade/treinamento_chat/novos_dados_treino.jsonl"
-
-    if not os.path.exists(FEEDBACK_NER_FILE):
-        logging.info("Nenhum novo dado de feedback para treinar.")
-        return
+    doc_bin = DocBin().from_disk(caminho)
+    escolhidos = set(random.sample(range(len(doc_bin)), min(tamanho, len(doc_bin))))
+    return [
+        Example(nlp.make_doc(doc.text), doc)
+        for i, doc in enumerate(doc_bin.get_docs(nlp.vocab))
+        if i in escolhidos
+    ]
 
+def retreinar_modelo_ner(nlp_instance):
+    """
+    Compila o feedback pendente para o DocBin acumulado e atualiza o componente NER
+    lendo os exemplos já tokenizados do disco. O resultado é salvo como uma nova versão
+    candidata, que a API avalia em modo sombra antes de ser promovida.
+    """
     try:
-        logging.info("Iniciando o processo de re-treinamento do modelo NER.")
-        
-        # Carrega os novos dados de treino do arquivo de feedback
-        train_examples = []
-        with open(FEEDBACK_NER_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                data = json.loads(line)
-                text = data[0]
-                annotations = data[1]
-                train_examples.append(Example.from_dict(nlp_instance.make_doc(text), annotations))
-
-        if not train_examples:
-            logging.info("Arquivo de feedback encontrado, mas está vazio. Nenhum treinamento necessário.")
+        novos = acumular_feedback(nlp_instance)
+        if not novos:
+            logging.info("Nenhum novo dado de feedback para treinar.")
             return
 
-        logging.info(f"Re-treinando com {len(train_examples)} novos exemplos.")
+        logging.info("Iniciando o processo de re-treinamento do modelo NER.")
+
+        # Feedback acumulado + uma amostra do corpus original, lidos do DocBin
+        train_examples = list(Corpus(FEEDBACK_PATH)(nlp_instance))
+        if TREINO_PATH.exists():
+            train_examples += _amostra_revisao(nlp_instance, TREINO_PATH, EXEMPLOS_REVISAO)
+
+        logging.info(f"Re-treinando com {novos} novos exemplos ({len(train_examples)} no total).")
 
         # Desativa outros pipes para focar no NER
         other_pipes = [pipe for pipe in nlp_instance.pipe_names if pipe != "ner"]
-        
-        with nlp_instance.disable_pipes(*other_pipes):
+
+        with nlp_instance.select_pipes(disable=other_pipes):
             optimizer = nlp_instance.resume_training()
             for i in range(10):
                 random.shuffle(train_examples)
                 losses = {}
-                nlp_instance.update(train_examples, drop=0.35, losses=losses, sgd=optimizer)
+                for batch in minibatch(train_examples, size=16):
+                    nlp_instance.update(batch, drop=0.35, losses=losses, sgd=optimizer)
                 logging.info(f"Iteração de re-treino {i+1}/10 - Perda: {losses.get('ner', 0.0):.4f}")
 
-        # Salva o modelo atualizado
-        Path(MODEL_PATH).mkdir(parents=True, exist_ok=True)
-        nlp_instance.to_disk(MODEL_PATH)
-        logging.info(f"Modelo re-treinado e salvo com sucesso em: {MODEL_PATH}")
-
-        # Limpa o arquivo de feedback após o uso bem-sucedido
-        with open(FEEDBACK_NER_FILE, 'w') as f:
-            f.write('')
-        logging.info("Arquivo de feedback limpo para novos dados.")
+        # Salva o modelo atualizado em uma nova versão, sem tocar na que está em uso
+        repositorio = repositorio_ner()
+        versao, diretorio = repositorio.nova_versao()
+        nlp_instance.to_disk(diretorio)
+        repositorio.registrar_candidato(versao)
+        logging.info(f"Modelo re-treinado salvo em '{diretorio}' e registrado como candidato.")
 
     except Exception as e:
-        logging.error(f"Erro durante o re-treinamento: {e}")
\ No newline at end of file
+        logging.error(f"Erro durante o re-treinamento: {e}")
@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import random
+import re
+from pathlib import Path
+
+import pandas as pd
+import spacy
+from spacy.tokens import DocBin
+
+# Configurações de log
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Caminhos dos arquivos
+CSV_PATH = "./pesquisa_por_similaridade/materiais.csv"
+FEEDBACK_NER_FILE = "./pesquisa_por_similaridade/treinamento_chat/dados_aprendizado.jsonl"
+# O feedback pendente é renomeado para cá antes de ser lido; a API continua gravando no original
+FEEDBACK_EM_PROCESSAMENTO = FEEDBACK_NER_FILE + ".processando"
+CORPUS_DIR = Path("./pesquisa_por_similaridade/treinamento_chat/corpus")
+TREINO_PATH = CORPUS_DIR / "treino.spacy"
+VALIDACAO_PATH = CORPUS_DIR / "validacao.spacy"
+FEEDBACK_PATH = CORPUS_DIR / "feedback.spacy"
+
+ROTULOS = ["DESCRICAO", "UM", "FAMILIA"]
+
+# Modelos de frase usados em 'dados_treino.py', preenchidos com os materiais do catálogo
+TEMPLATES = [
+    "Procure por um material com a descricao {DESCRICAO}, com UM {UM} e familia {FAMILIA}.",
+    "Preciso de {DESCRICAO}, com a unidade de medida {UM} e da familia {FAMILIA}.",
+    "Você poderia procurar {DESCRICAO}? Unidade de medida {UM}, familia {FAMILIA}.",
+    "Busco por {DESCRICAO}, UM {UM}, familia {FAMILIA}.",
+    "Queria encontrar um material com a descricao {DESCRICAO}, UM {UM} e familia {FAMILIA}.",
+    "Preciso de um {DESCRICAO}",
+    "Busco por {DESCRICAO}",
+]
+CAMPO_TEMPLATE = re.compile(r"\{(\w+)\}")
+
+def preencher_template(template, valores):
+    """Monta a frase a partir do modelo e retorna (texto, {'entities': [(início, fim, rótulo)]})."""
+    partes = []
+    entidades = []
+    posicao = 0
+    tamanho = 0
+    for match in CAMPO_TEMPLATE.finditer(template):
+        literal = template[posicao:match.start()]
+        partes.append(literal)
+        tamanho += len(literal)
+
+        rotulo = match.group(1)
+        valor = str(valores[rotulo])
+        entidades.append((tamanho, tamanho + len(valor), rotulo))
+        partes.append(valor)
+        tamanho += len(valor)
+        posicao = match.end()
+    partes.append(template[posicao:])
+    return "".join(partes), {"entities": entidades}
+
+def carregar_materiais():
+    """Lê as linhas (DESCRICAO, UM, FAMILIA) de 'materiais.csv', ignorando as sem descrição."""
+    dados = pd.read_csv(
+        CSV_PATH, sep=";", encoding="ISO-8859-1",
+        usecols=["DESCRICAO", "UM", "FAMILIA"], dtype=str, keep_default_na=False
+    )
+    materiais = []
+    for descricao, um, familia in dados.itertuples(index=False):
+        descricao, um, familia = descricao.strip(), um.strip(), familia.strip()
+        if descricao:
+            materiais.append((descricao, um, familia))
+    return materiais
+
+def dividir_materiais(materiais, fracao_validacao=0.1, semente=42):
+    """
+    Divide os materiais (e não as frases) entre treino e validação. Todas as frases de
+    uma mesma descrição ficam do mesmo lado, para a validação medir descrições novas.
+    """
+    descricoes = sorted({descricao.lower() for descricao, _, _ in materiais})
+    random.Random(semente).shuffle(descricoes)
+    n_validacao = int(len(descricoes) * fracao_validacao) if len(descricoes) > 1 else 0
+    descricoes_validacao = set(descricoes[:n_validacao])
+
+    treino = [m for m in materiais if m[0].lower() not in descricoes_validacao]
+    validacao = [m for m in materiais if m[0].lower() in descricoes_validacao]
+    return treino, validacao
+
+def gerar_exemplos_catalogo(materiais, exemplos_por_material=2, semente=42):
+    """Gera frases de treino a partir dos materiais do catálogo (ver carregar_materiais)."""
+    aleatorio = random.Random(semente)
+    exemplos = []
+    for descricao, um, familia in materiais:
+        for template in aleatorio.sample(TEMPLATES, min(exemplos_por_material, len(TEMPLATES))):
+            if ("{UM}" in template and not um) or ("{FAMILIA}" in template and not familia):
+                continue
+            # Parte das frases usa a descrição em minúsculas, como os usuários escrevem no chat
+            texto_descricao = descricao.lower() if aleatorio.random() < 0.3 else descricao
+            exemplos.append(preencher_template(template, {"DESCRICAO": texto_descricao, "UM": um, "FAMILIA": familia}))
+    return exemplos
+
+def carregar_feedback_pendente(caminho=FEEDBACK_NER_FILE):
+    """Lê os exemplos de feedback gravados pela API e ainda não compilados."""
+    exemplos = []
+    if not os.path.exists(caminho):
+        return exemplos
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                texto, anotacoes = json.loads(line)
+                exemplos.append((texto, anotacoes))
+    return exemplos
+
+def _exemplos_de_docbin(nlp, caminho):
+    if not Path(caminho).exists():
+        return []
+    docs = DocBin().from_disk(caminho).get_docs(nlp.vocab)
+    return [
+        (doc.text, {"entities": [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]})
+        for doc in docs
+    ]
+
+def deduplicar(exemplos):
+    vistos = set()
+    unicos = []
+    for texto, anotacoes in exemplos:
+        chave = (texto, tuple(sorted(tuple(ent) for ent in anotacoes.get("entities", []))))
+        if chave not in vistos:
+            vistos.add(chave)
+            unicos.append((texto, anotacoes))
+    return unicos
+
+def salvar_docbin(nlp, exemplos, caminho):
+    """Tokeniza os exemplos uma única vez e grava os Docs anotados em um DocBin."""
+    doc_bin = DocBin()
+    ignorados = 0
+    for texto, anotacoes in exemplos:
+        doc = nlp.make_doc(texto)
+        spans = [doc.char_span(inicio, fim, label=rotulo) for inicio, fim, rotulo in anotacoes.get("entities", [])]
+        if any(span is None for span in spans):
+            ignorados += 1
+            continue
+        try:
+            doc.ents = spans
+        except ValueError:
+            ignorados += 1
+            continue
+        doc_bin.add(doc)
+
+    if ignorados:
+        logging.warning(f"{ignorados} exemplo(s) ignorado(s) por entidades que não se alinham aos tokens.")
+    Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+    doc_bin.to_disk(caminho)
+    return len(doc_bin)
+
+def construir_corpus(exemplos_extra=(), exemplos_por_material=2, fracao_validacao=0.1, semente=42):
+    """
+    Gera o corpus de treino: frases do catálogo + exemplos extras (ex.: 'dados_treino.py')
+    + feedback acumulado, sem duplicatas. A validação tem só frases de materiais do
+    catálogo separados antes de gerar as frases; extras e feedback vão para o treino.
+    """
+    nlp = spacy.blank("pt")
+
+    materiais_treino, materiais_validacao = dividir_materiais(carregar_materiais(), fracao_validacao, semente)
+    validacao = deduplicar(gerar_exemplos_catalogo(materiais_validacao, exemplos_por_material, semente))
+
+    treino = list(exemplos_extra)
+    treino += gerar_exemplos_catalogo(materiais_treino, exemplos_por_material, semente)
+    treino += _exemplos_de_docbin(nlp, FEEDBACK_PATH)
+    treino += carregar_feedback_pendente(FEEDBACK_EM_PROCESSAMENTO)
+    treino += carregar_feedback_pendente()
+    treino = deduplicar(treino)
+    random.Random(semente).shuffle(treino)
+
+    total_treino = salvar_docbin(nlp, treino, TREINO_PATH)
+    total_validacao = salvar_docbin(nlp, validacao, VALIDACAO_PATH)
+    logging.info(f"Corpus gerado em '{CORPUS_DIR}': {total_treino} exemplos de treino e {total_validacao} de validação.")
+    return total_treino, total_validacao
+
+def corpus_desatualizado():
+    """Indica se o corpus precisa ser gerado de novo (ausente ou mais antigo que o CSV)."""
+    if not TREINO_PATH.exists() or not VALIDACAO_PATH.exists():
+        return True
+    return os.path.getmtime(CSV_PATH) > os.path.getmtime(TREINO_PATH)
+
+def acumular_feedback(nlp):
+    """
+    Move o feedback pendente (JSONL gravado pela API) para o DocBin de feedback acumulado.
+    O JSONL é renomeado antes da leitura, então o que a API gravar nesse meio tempo vai
+    para um arquivo novo e fica para a próxima vez. Retorna quantos exemplos novos foram
+    adicionados.
+    """
+    # Um arquivo que sobrou de uma execução interrompida é processado antes
+    if not os.path.exists(FEEDBACK_EM_PROCESSAMENTO):
+        if not os.path.exists(FEEDBACK_NER_FILE):
+            return 0
+        os.replace(FEEDBACK_NER_FILE, FEEDBACK_EM_PROCESSAMENTO)
+
+    pendentes = carregar_feedback_pendente(FEEDBACK_EM_PROCESSAMENTO)
+    total_antes = total = 0
+    if pendentes:
+        acumulados = _exemplos_de_docbin(nlp, FEEDBACK_PATH)
+        total_antes = len(acumulados)
+        total = salvar_docbin(nlp, deduplicar(acumulados + pendentes), FEEDBACK_PATH)
+
+    os.remove(FEEDBACK_EM_PROCESSAMENTO)
+    return total - total_antes
+
+if __name__ == '__main__':
+    from dados_treino import dados_treino
+    construir_corpus(exemplos_extra=dados_treino)
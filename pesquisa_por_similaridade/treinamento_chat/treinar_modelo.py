@@ -1,35 +1,47 @@
 import spacy
-import random
 import logging
+import sys
 from pathlib import Path
-from spacy.training import Example
+from spacy.training import Corpus
+from spacy.util import minibatch, compounding
+from gerar_corpus import construir_corpus, corpus_desatualizado, ROTULOS, TREINO_PATH, VALIDACAO_PATH
+
+# O versionamento dos modelos fica no pacote acima deste script
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from versionamento import repositorio_ner
 
 # Configurações de log
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Definir o diretório de saída para salvar o modelo
-output_dir = Path("./pesquisa_por_similaridade/treinamento_chat/treinamento_chat_materiais")
-
-def treinar_ner(n_iter=300):
+def treinar_ner(n_iter=30, forcar=False):
     """
-    Treina o modelo de reconhecimento de entidades com os dados fornecidos.
+    Treina o modelo de reconhecimento de entidades com o corpus compilado em DocBin.
+    O modelo é salvo como uma nova versão e promovido. Se já houver um modelo em uso
+    (inclusive um re-treinado com feedback), nada é feito, a não ser com forcar=True.
     """
+    repositorio = repositorio_ner()
+    if repositorio.ler_manifesto()["atual"] and not forcar:
+        logging.info("Já existe um modelo NER em uso. Use '--forcar' para treinar um novo do zero.")
+        return
+
     logging.info("Iniciando o processo de treinamento do modelo NER.")
 
-    # Carregar os dados de treino
+    # Gera o corpus (catálogo + dados_treino + feedback) se ele ainda não existir
     try:
-        from dados_treino import dados_treino
-        if not dados_treino:
-            logging.error("O arquivo não contém dados. Abortando.")
-            return
-        logging.info(f"Dados de treino carregados com sucesso. Total de exemplos: {len(dados_treino)}")
-    except ImportError:
-        logging.error("Erro: O arquivo não foi encontrado.")
-        return
+        if corpus_desatualizado():
+            from dados_treino import dados_treino
+            logging.info("Corpus de treino ausente ou desatualizado. Gerando a partir do catálogo...")
+            construir_corpus(exemplos_extra=dados_treino)
+        else:
+            logging.info(f"Usando o corpus de treino já compilado em '{TREINO_PATH}'.")
     except Exception as e:
-        logging.error(f"Erro inesperado ao carregar os dados de treino: {e}")
+        logging.error(f"Erro ao gerar o corpus de treino: {e}")
         return
 
+    # Os Docs já tokenizados e anotados são lidos do disco a cada época
+    corpus_treino = Corpus(TREINO_PATH, shuffle=True)
+    corpus_validacao = Corpus(VALIDACAO_PATH)
+
     # Inicializar o pipeline do spaCy
     try:
         nlp = spacy.blank("pt")
@@ -37,13 +49,12 @@ def treinar_ner(n_iter=300):
             ner = nlp.add_pipe("ner", last=True)
         else:
             ner = nlp.get_pipe("ner")
-        
+
         logging.info("Componente NER adicionado ao pipeline do spaCy.")
 
         # Adicionar os rótulos de entidades
-        for _, annotations in dados_treino:
-            for ent in annotations.get("entities"):
-                ner.add_label(ent[2])
+        for rotulo in ROTULOS:
+            ner.add_label(rotulo)
 
     except Exception as e:
         logging.error(f"Erro ao inicializar o pipeline do spaCy ou adicionar rótulos: {e}")
@@ -51,34 +62,35 @@ def treinar_ner(n_iter=300):
 
     # Treinar o modelo
     try:
-        # Converter os dados de treino para o novo formato (objetos Example)
-        examples = []
-        for text, annotations in dados_treino:
-            examples.append(Example.from_dict(nlp.make_doc(text), annotations))
-
         pipe_exceptions = ["ner", "trf_wordpiecer", "trf_tok2vec"]
         other_pipes = [pipe for pipe in nlp.pipe_names if pipe not in pipe_exceptions]
-        
-        with nlp.disable_pipes(*other_pipes):
-            optimizer = nlp.begin_training()
+
+        with nlp.select_pipes(disable=other_pipes):
+            optimizer = nlp.initialize(lambda: corpus_treino(nlp))
             for i in range(n_iter):
-                random.shuffle(examples)
                 losses = {}
-                nlp.update(examples, drop=0.5, losses=losses, sgd=optimizer)
-                logging.info(f"Iteração {i+1}/{n_iter} - Perda: {losses['ner']:.4f}")
-    
+                for batch in minibatch(corpus_treino(nlp), size=compounding(4.0, 32.0, 1.001)):
+                    nlp.update(batch, drop=0.5, losses=losses, sgd=optimizer)
+
+                scores = nlp.evaluate(corpus_validacao(nlp))
+                logging.info(
+                    f"Iteração {i+1}/{n_iter} - Perda: {losses.get('ner', 0.0):.4f} - "
+                    f"F1 validação: {scores.get('ents_f') or 0.0:.4f}"
+                )
+
     except Exception as e:
         logging.error(f"Erro durante o treinamento: {e}")
-        logging.error("Verifique a formatação dos seus dados de treino. A lista de exemplos precisa ser '[(texto, {'entities': [(...)]}), ...]'")
+        logging.error("Verifique o corpus de treino. Gere-o novamente com 'gerar_corpus.py'.")
         return
 
-    # Salvar o modelo treinado
+    # Salvar o modelo treinado como uma nova versão e colocá-la em uso
     try:
-        output_dir.mkdir(parents=True, exist_ok=True)
+        versao, output_dir = repositorio.nova_versao()
         nlp.to_disk(output_dir)
+        repositorio.promover(versao)
         logging.info(f"Modelo spaCy treinado e salvo com sucesso em: {output_dir}")
     except Exception as e:
         logging.error(f"Erro ao salvar o modelo treinado: {e}")
 
 if __name__ == '__main__':
-    treinar_ner()
\ No newline at end of file
+    treinar_ner(forcar="--forcar" in sys.argv)
\ No newline at end of file
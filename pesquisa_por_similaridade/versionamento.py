@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: o lock entre processos fica desativado
+    fcntl = None
+
+# Diretórios versionados dos artefatos e os caminhos usados antes do versionamento
+MODELOS_NER_DIR = "./pesquisa_por_similaridade/treinamento_chat/modelos_ner"
+MODELO_NER_LEGADO = "./pesquisa_por_similaridade/treinamento_chat/treinamento_chat_materiais"
+INDICES_DIR = "./pesquisa_por_similaridade/indices"
+INDICE_LEGADO = "./pesquisa_por_similaridade"
+
+MANIFESTO = "manifesto.json"
+VERSOES_MANTIDAS = 5
+# Entrada do histórico que representa o artefato legado (anterior ao versionamento)
+VERSAO_LEGADA = "legado"
+
+class RepositorioVersoes:
+    """
+    Guarda versões imutáveis de um artefato em '<base>/versoes/<id>' e um manifesto que
+    indica a versão em uso ('atual'), as anteriores ('historico') e a candidata.
+    Promover ou reverter uma versão é só reescrever o manifesto, de forma atômica;
+    nenhum arquivo em uso é sobrescrito.
+    """
+    def __init__(self, base_dir, legado=None):
+        self.base_dir = base_dir
+        self.legado = legado
+        self.versoes_dir = os.path.join(base_dir, "versoes")
+        self.manifesto_path = os.path.join(base_dir, MANIFESTO)
+
+    @contextmanager
+    def _travado(self):
+        """Serializa as alterações do manifesto entre processos (API e worker)."""
+        os.makedirs(self.base_dir, exist_ok=True)
+        with open(os.path.join(self.base_dir, ".lock"), "w") as arquivo_lock:
+            if fcntl is not None:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+    def ler_manifesto(self):
+        try:
+            with open(self.manifesto_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"atual": None, "historico": [], "candidato": None}
+
+    def _gravar_manifesto(self, manifesto):
+        temporario = f"{self.manifesto_path}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(manifesto, f, indent=2)
+        os.replace(temporario, self.manifesto_path)
+
+    def caminho(self, versao):
+        if versao == VERSAO_LEGADA:
+            return self.legado
+        return os.path.join(self.versoes_dir, versao)
+
+    def caminho_atual(self):
+        """Diretório da versão em uso (ou o caminho legado, se nada foi promovido ainda)."""
+        atual = self.ler_manifesto()["atual"]
+        return self.caminho(atual) if atual else self.legado
+
+    def nova_versao(self):
+        """Reserva um diretório vazio para uma nova versão, ainda não registrada no manifesto."""
+        versao = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(self.caminho(versao))
+        return versao, self.caminho(versao)
+
+    def registrar_candidato(self, versao):
+        with self._travado():
+            manifesto = self.ler_manifesto()
+            manifesto["candidato"] = versao
+            self._gravar_manifesto(manifesto)
+        self.limpar_versoes()
+
+    def promover(self, versao):
+        with self._travado():
+            manifesto = self.ler_manifesto()
+            if manifesto["atual"] and manifesto["atual"] != versao:
+                manifesto["historico"].append(manifesto["atual"])
+            elif not manifesto["atual"] and self.legado and os.path.exists(self.legado):
+                # Primeira promoção: o artefato legado vira a versão anterior, para o
+                # rollback poder voltar a ele
+                manifesto["historico"].append(VERSAO_LEGADA)
+            manifesto["atual"] = versao
+            if manifesto.get("candidato") == versao:
+                manifesto["candidato"] = None
+            self._gravar_manifesto(manifesto)
+        logging.info(f"Versão '{versao}' promovida em '{self.base_dir}'.")
+        self.limpar_versoes()
+
+    def versao_anterior(self):
+        historico = self.ler_manifesto()["historico"]
+        return historico[-1] if historico else None
+
+    def rollback(self):
+        """Volta para a versão anterior. Lança ValueError se não houver para onde voltar."""
+        with self._travado():
+            manifesto = self.ler_manifesto()
+            if not manifesto["historico"]:
+                raise ValueError("Não há versão anterior para restaurar.")
+            manifesto["atual"] = manifesto["historico"].pop()
+            self._gravar_manifesto(manifesto)
+        logging.info(f"Rollback em '{self.base_dir}': versão '{manifesto['atual']}' restaurada.")
+        return manifesto["atual"]
+
+    def limpar_versoes(self, manter=VERSOES_MANTIDAS):
+        """Apaga as versões que não estão em uso nem entre as 'manter' últimas do histórico."""
+        with self._travado():
+            manifesto = self.ler_manifesto()
+            manifesto["historico"] = manifesto["historico"][-manter:]
+            em_uso = set(manifesto["historico"]) | {manifesto["atual"], manifesto.get("candidato")}
+            self._gravar_manifesto(manifesto)
+        if not os.path.isdir(self.versoes_dir):
+            return
+        # Só apaga versões mais antigas que a última registrada, para não remover
+        # um diretório que outro processo acabou de reservar e ainda está gravando
+        registradas = sorted(v for v in em_uso if v and v != VERSAO_LEGADA)
+        limite = registradas[-1] if registradas else ""
+        for versao in os.listdir(self.versoes_dir):
+            if versao not in em_uso and versao < limite:
+                shutil.rmtree(self.caminho(versao), ignore_errors=True)
+
+def repositorio_ner():
+    return RepositorioVersoes(MODELOS_NER_DIR, legado=MODELO_NER_LEGADO)
+
+def repositorio_indice():
+    return RepositorioVersoes(INDICES_DIR, legado=INDICE_LEGADO)